@@ -0,0 +1,164 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from metrics import timed
+
+
+#%% Returns grouped by volume bucket
+# One pass over the bars: each return is assigned to its volume quantile bucket
+# with searchsorted, and bincount accumulates count, sum, sum of squares and sum
+# of cubes per bucket. Those sums are all that is kept, so appending bars only
+# touches the new rows; a last bar that was revised since (the intraday bar once
+# the day has closed) is subtracted and added again.
+
+TRADING_DAYS = 252
+
+
+def round_significant(x, digits=4):
+    x = np.asarray(x, dtype=np.float64)
+    magnitude = np.floor(np.log10(np.where(x == 0, 1, np.abs(x)))).astype(int)
+    return np.array([round(v, digits - 1 - m) for v, m in zip(x, magnitude)])
+
+
+def bucket_labels(edges):
+    edges = round_significant(edges)
+    return ["{:g}-{:g}".format(left, right) if abs(right) < 1e6
+            else "{:.0f}-{:.0f}".format(left, right) for left, right in zip(edges[:-1], edges[1:])]
+
+
+class VolumeBuckets:
+    """Running per-bucket moments of returns, bucketed by fixed volume edges."""
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        n = len(self.edges) - 1
+        self.count = np.zeros(n)
+        self.sums = np.zeros((3, n))
+        self.last_date = None
+        self.last_close = None
+        self.last_volume = None
+        # What the last bar added, so a revised last bar can be taken out again:
+        # (bucket, return) or None, and the date and close of the bar before it
+        self.last_added = None
+        self.prev_date = None
+        self.prev_close = None
+
+    @classmethod
+    def fit(cls, hist, buckets=20):
+        volume = hist["Volume"].to_numpy(dtype=np.float64)[1:]
+        edges = np.unique(np.quantile(volume, np.linspace(0, 1, buckets + 1)))
+        state = cls(edges)
+        state.add(hist)
+        return state
+
+    def changed(self, hist):
+        # hist has a different close or volume for the last bar already added,
+        # e.g. the intraday bar of the previous refresh after the close
+        if self.last_date is None:
+            return False
+        i = hist["Date"].searchsorted(self.last_date)
+        if i == len(hist) or hist["Date"].iloc[i] != self.last_date:
+            return False
+        return not (np.isclose(hist["Close"].iloc[i], self.last_close, rtol=1e-9, atol=0)
+                    and hist["Volume"].iloc[i] == self.last_volume)
+
+    def retract(self):
+        # Subtract the last bar's contribution; the next add() puts it back revised
+        if self.last_added is not None:
+            idx, r = self.last_added
+            self.count[idx] -= 1
+            for power in range(3):
+                self.sums[power][idx] -= r ** (power + 1)
+        self.last_date, self.last_close = self.prev_date, self.prev_close
+        self.last_volume = self.last_added = self.prev_date = self.prev_close = None
+        return self
+
+    def add(self, hist):
+        # Accumulate the bars of hist that come after the last one already added
+        if self.changed(hist):
+            self.retract()
+        if self.last_date is not None:
+            hist = hist[hist["Date"] > self.last_date]
+        if hist.empty:
+            return self
+        close = hist["Close"].to_numpy(dtype=np.float64)
+        volume = hist["Volume"].to_numpy(dtype=np.float64)
+        dates = hist["Date"]
+        if len(hist) > 1:
+            self.prev_date, self.prev_close = dates.iloc[-2], close[-2]
+        else:
+            self.prev_date, self.prev_close = self.last_date, self.last_close
+        if self.last_close is None:
+            returns, volume = close[1:] / close[:-1] - 1, volume[1:]
+        else:
+            returns = close / np.append(self.last_close, close[:-1]) - 1
+        keep = np.isfinite(returns)
+        returns, volume = returns[keep], volume[keep]
+
+        # Same intervals as pd.qcut: (left, right], the first one closed on the left
+        idx = np.searchsorted(self.edges[1:-1], volume, side="left")
+        n = len(self.count)
+        self.count += np.bincount(idx, minlength=n)
+        for power in range(3):
+            self.sums[power] += np.bincount(idx, weights=returns ** (power + 1), minlength=n)
+        self.last_added = (idx[-1], returns[-1]) if len(keep) and keep[-1] else None
+        self.last_date = dates.iloc[-1]
+        self.last_close = close[-1]
+        self.last_volume = hist["Volume"].iloc[-1]
+        return self
+
+    def stats(self):
+        n = self.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.sums[0] / n
+            m2 = self.sums[1] / n - mean ** 2
+            m3 = self.sums[2] / n - 3 * mean * self.sums[1] / n + 2 * mean ** 3
+            std = np.sqrt(np.maximum(m2, 0) * n / (n - 1))
+            skew = m3 / np.maximum(m2, 0) ** 1.5
+        return pd.DataFrame(dict(
+            label = bucket_labels(self.edges),
+            left = self.edges[:-1],
+            right = self.edges[1:],
+            count = n.astype(np.int64),
+            mean = mean,
+            std = std,
+            volatility = std * np.sqrt(TRADING_DAYS),
+            skew = skew,
+        ))
+
+
+_buckets = {}
+_lock = threading.Lock()
+
+
+def _reset_lock():
+    # A forked job process may inherit _lock held by a thread it does not have
+    global _lock
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_lock)
+
+
+@timed("compute")
+def volume_bucket_stats(ticker, hist, buckets=20, refit=False):
+    # Per-ticker stats; bin edges are fitted once and later bars are added on top
+    key = (ticker, buckets)
+    with _lock:
+        state = _buckets.get(key)
+        stale = state is None or refit or hist.empty or hist["Date"].iloc[-1] < state.last_date
+        if stale:
+            state = _buckets[key] = VolumeBuckets.fit(hist, buckets)
+        else:
+            state.add(hist)
+        return state.stats()
+
+
+def batch_volume_bucket_stats(histories, buckets=20):
+    # {ticker: hist} -> one frame with a ticker column
+    frames = [volume_bucket_stats(ticker, hist, buckets).assign(ticker = ticker)
+              for ticker, hist in histories.items()]
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,193 @@
+// Clientside period switching and zoom for the time series graphs.
+// The server ships one typed-array encoded series per ticker into the
+// "series-store" dcc.Store (see series_payload in assignment3_zhuoran.py);
+// dropdown periods, rangeselector buttons and zooming are answered here from
+// that series without a request to the server.
+(function () {
+    var decoded = {};
+
+    function decode(array) {
+        var binary = atob(array.bdata);
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        if (array.dtype === "f4") {
+            return new Float32Array(bytes.buffer);
+        }
+        return new Float64Array(bytes.buffer);
+    }
+
+    function series(payload) {
+        // Decoded once per ticker and data version, shared by both graphs
+        var key = payload.ticker + "|" + payload.version;
+        if (!decoded[key]) {
+            decoded = {};
+            decoded[key] = {x: decode(payload.x), y: decode(payload.y)};
+        }
+        return decoded[key];
+    }
+
+    function searchSorted(x, value, right) {
+        var lo = 0, hi = x.length;
+        while (lo < hi) {
+            var mid = (lo + hi) >> 1;
+            if (x[mid] < value || (right && x[mid] === value)) {
+                lo = mid + 1;
+            } else {
+                hi = mid;
+            }
+        }
+        return lo;
+    }
+
+    function addMonths(ms, months) {
+        // Same end-of-month clamping as pandas.DateOffset(months=...)
+        var d = new Date(ms);
+        var m = d.getUTCMonth() + months;
+        var year = d.getUTCFullYear() + Math.floor(m / 12);
+        var month = ((m % 12) + 12) % 12;
+        var days = new Date(Date.UTC(year, month + 1, 0)).getUTCDate();
+        return Date.UTC(year, month, Math.min(d.getUTCDate(), days),
+                        d.getUTCHours(), d.getUTCMinutes(), d.getUTCSeconds());
+    }
+
+    function periodStart(period, x) {
+        // First row of the period, as data_store.slice_period finds it
+        var n = x.length;
+        if (!period || period === "max" || n === 0) {
+            return 0;
+        }
+        period = period.toLowerCase();
+        var last = x[n - 1];
+        if (period === "ytd") {
+            return searchSorted(x, Date.UTC(new Date(last).getUTCFullYear(), 0, 1), true);
+        }
+        var count = parseInt(period, 10);
+        if (/^\d+d$/.test(period)) {
+            return Math.max(n - count, 0);
+        }
+        var start;
+        if (/mo$/.test(period)) {
+            start = addMonths(last, -count);
+        } else if (/wk$/.test(period)) {
+            start = last - count * 7 * 86400000;
+        } else if (/y$/.test(period)) {
+            start = addMonths(last, -12 * count);
+        } else {
+            return 0;
+        }
+        return searchSorted(x, start, true);
+    }
+
+    function parseDate(value) {
+        // Axis range values come back as "2020-01-31 12:00:00.1234" wall-clock strings
+        if (typeof value === "number") {
+            return value;
+        }
+        var s = String(value).trim().replace(" ", "T").replace(/(\.\d{3})\d+/, "$1");
+        if (s.length === 10) {
+            s += "T00:00:00";
+        }
+        return Date.parse(s + "Z");
+    }
+
+    function relayoutWindow(relayout) {
+        // Mirrors downsample.relayout_window: [start, end], null to reset, false to ignore
+        if (!relayout) {
+            return false;
+        }
+        if ("xaxis.range[0]" in relayout && "xaxis.range[1]" in relayout) {
+            return [relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]];
+        }
+        if ("xaxis.range" in relayout) {
+            return relayout["xaxis.range"];
+        }
+        if (relayout["xaxis.autorange"]) {
+            return null;
+        }
+        return false;
+    }
+
+    function minmax(x, y, lo, hi, nOut) {
+        // Lowest and highest point of each bucket, like downsample.minmax
+        var n = hi - lo;
+        if (n <= nOut || nOut < 4) {
+            return {x: x.subarray(lo, hi), y: y.subarray(lo, hi)};
+        }
+        var size = Math.ceil(n / Math.floor(nOut / 2));
+        var keep = [lo];
+        for (var start = lo; start < hi; start += size) {
+            var end = Math.min(start + size, hi), iMin = start, iMax = start;
+            for (var i = start + 1; i < end; i++) {
+                if (y[i] < y[iMin]) iMin = i;
+                if (y[i] > y[iMax]) iMax = i;
+            }
+            keep.push(Math.min(iMin, iMax), Math.max(iMin, iMax));
+        }
+        keep.push(hi - 1);
+        var outX = new Float64Array(keep.length), outY = new Float64Array(keep.length), k = 0;
+        for (var j = 0; j < keep.length; j++) {
+            if (j > 0 && keep[j] === keep[j - 1]) continue;
+            outX[k] = x[keep[j]];
+            outY[k] = y[keep[j]];
+            k++;
+        }
+        return {x: outX.subarray(0, k), y: outY.subarray(0, k)};
+    }
+
+    function figure(period, payload, relayout) {
+        var ns = window.dash_clientside;
+        if (!payload) {
+            return ns.no_update;
+        }
+        var zoomed = ns.callback_context.triggered.some(function (t) {
+            return /\.relayoutData$/.test(t.prop_id);
+        });
+        var range = zoomed ? relayoutWindow(relayout) : null;
+        if (range === false) {
+            return ns.no_update;
+        }
+
+        var data = series(payload);
+        var lo = periodStart(period, data.x), hi = data.x.length;
+        if (range) {
+            lo = Math.max(lo, searchSorted(data.x, parseDate(range[0]), false));
+            hi = Math.min(hi, searchSorted(data.x, parseDate(range[1]), true));
+        }
+        var points = minmax(data.x, data.y, lo, hi, payload.max_points);
+
+        var layout = JSON.parse(JSON.stringify(payload.layout));
+        layout.title.text = layout.title.text.replace("{period}", period || "max");
+        layout.uirevision = payload.ticker + "|" + (period || "max");
+        layout.xaxis.type = "date";
+        if (range) {
+            layout.xaxis.range = range;
+            layout.xaxis.autorange = false;
+        } else {
+            layout.xaxis.autorange = true;
+        }
+        return {
+            data: [{
+                type: "scatter",
+                mode: "markers",
+                x: points.x,
+                y: points.y,
+                marker: {color: "#636efa"},
+                hovertemplate: "Date=%{x}<br>Open=%{y}<extra></extra>"
+            }],
+            layout: layout
+        };
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        timeseries: {
+            period_figure: function (period, payload, relayout) {
+                return figure(period, payload, relayout);
+            },
+            max_figure: function (payload, relayout) {
+                return figure("max", payload, relayout);
+            }
+        }
+    });
+})();
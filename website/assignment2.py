@@ -1,110 +1,36 @@
 
-import dash
-import pandas as pd
-import yfinance as yf
+import time
+STARTED = time.perf_counter() # Reference point for time-to-first-byte
+
 import plotly.express as px
 import plotly.graph_objects as go
-from dash import Dash, html, dcc, Input, Output
-import numpy as np
+from dash import Dash, html, dcc, callback, Input, Output
+import logging
+
+from analytics import volume_bucket_stats
+from data_store import default_store, slice_period
+from fetch_pool import pool_from_env
+from metrics import install_metrics, metrics, stage, timed
+from server_timing import install_timing
+from symbols import symbol_datalist, symbol_message, valid_ticker
+
+log = logging.getLogger(__name__)
 #%% Data Download Section
 
-def download_data(ticker):
-    myTicker = yf.Ticker(ticker)
-    hist = myTicker.history(period="max")
+store = default_store()
+fetch_pool = pool_from_env()
+metrics.add_gauges("dash_fetch_pool", fetch_pool.info) # served at /metrics
 
-    hist = hist.reset_index()
-    hist['Date'] = pd.to_datetime(hist['Date'], errors = 'coerce')
-    return hist
+@timed("download")
+def download_data(ticker):
+    # Off the request thread, with timeout/retry and the last good copy on failure
+    return fetch_pool.call(store.load, ticker).copy()
 
     # hist['Date'].max()
 
 ticker = "AAPL"
-hist = download_data(ticker)
-
-from scipy.stats import norm
-data=hist["Close"].pct_change()
-log_returns = np.log(1 + data)
-u = log_returns.mean()
-var = log_returns.var()
-drift = u - (0.5*var)
-stdev = log_returns.std()
-days = 30
-trials = 10000
-Z = norm.ppf(np.random.rand(days, trials)) #days, trials
-daily_returns = np.exp(drift.values + stdev.values * Z)
-price_paths = np.zeros_like(daily_returns)
-price_paths[0] = data.iloc[-1]
-for t in range(1, days):
-    price_paths[t] = price_paths[t-1]*daily_returns[t]
-
-
-#%% Graph generation
-fig = px.scatter(hist, y="Open", x='Date')
-
-# The update_layout method allows us to give some formatting to the graph
-fig.update_layout(
-    title_text = "Time Series Plot of {}".format(ticker),
-    title_x = 0.5,
-    yaxis = {
-        'title': 'Price'}
-)
-
-
-# here another blank no change4
-
-# Add range slider
-fig.update_layout(
-    xaxis=dict(
-        rangeselector=dict(
-            buttons=list([
-                dict(count=1,
-                     label="1m",
-                     step="month",
-                     # stepmode="backward"
-                     ),
-                dict(count=6,
-                     label="6m",
-                     step="month",
-                     # stepmode="backward"
-                     ),
-                dict(count=1,
-                     label="YTD",
-                     step="year",
-                     # stepmode="todate"
-                     ),
-                dict(count=1,
-                     label="1y",
-                     step="year",
-                     # stepmode="backward"
-                     ),
-                dict(step="all")
-            ])
-        ),
-        rangeslider=dict(
-            visible=False
-        ),
-        # type="date",
-        # title='This is a date'
-    )
-)
-
-# 
-hist["returns"] = hist["Close"].pct_change()
-hist.dropna(inplace=True)
-
-hist["labels"] = pd.qcut(hist["Volume"], 20)
-returns_mean = hist.groupby("labels")["returns"].mean()
-
-data = []
-data.append(
-    go.Bar(
-    name = "returns distribution",
-    x = [f"{round(x.left, -len(str(x.left))+4)}-{round(x.right, -len(str(x.right))+4)}" for x in returns_mean.index.categories],
-    y = returns_mean.tolist()
-    )
-)
-
 
+@timed("figure")
 def make_barchart(data):
     fig = go.Figure(data = data)
 
@@ -129,193 +55,211 @@ def make_barchart(data):
     fig.layout.hovermode = 'x'
     return(fig)
 
-fig2 = make_barchart(data)
-
 def download_data_time(ticker, period_new):
-    myTicker = yf.Ticker(ticker)
-    hist = myTicker.history(period=period_new)
-
-    hist = hist.reset_index()
-    hist['Date'] = pd.to_datetime(hist['Date'], errors = 'coerce')
-    return hist
+    # Sliced from the stored full history instead of a new provider call
+    return slice_period(download_data(ticker), period_new)
 
     # hist['Date'].max()
 
 
 #%% Dash app
-app = Dash()
-
-app.layout = html.Div(
-    [
-        "See how it will be displayed",
-        html.Center(html.H4('My Second Dash App - Yey!!!')),
-        html.Br(),
-        html.Br(),
-
-        dcc.Input(
-            id="my-input",
-            type="text",
-            placeholder="Please input stock symbol name Default AAPL: ",
-            style={ "width": "20%"}
-        ),
-
-        html.Br(),
-        html.Br(),
-        dcc.Dropdown(id='dropdown',
-        options=[{'label': 'max', 'value': 'max'},
-                {'label': '1y', 'value': '1y'},
-                {'label': '6mo', 'value': '6mo'},
-                {'label': '1mo', 'value': '1mo'},
-                {'label': '5d', 'value': '5d'}],
-            placeholder = 'max'
-            #options=[{'labels': comp['label'], 'value':comp['label']} for comp in comp_options]
-        ),
-        #html.H4('Price graph of different period', style = {'text-align': 'center', 'color':'blue','font-weight': 'bold'}),
-        # multiple line of text
+def create_app():
+    # Nothing is downloaded here: the graphs start empty and the initial
+    # callbacks fill them in once the page has loaded
+    app = Dash(__name__)
+    app.startup_timing = install_timing(app.server, STARTED)
+    app.metrics = install_metrics(app.server)
+
+    app.layout = html.Div(
+        [
+            "See how it will be displayed",
+            html.Center(html.H4('My Second Dash App - Yey!!!')),
+            html.Br(),
+            html.Br(),
+
+            dcc.Input(
+                id="my-input",
+                type="text",
+                placeholder="Please input stock symbol name Default AAPL: ",
+                style={ "width": "20%"},
+                debounce=True,
+                list="symbol-list"
+            ),
+            symbol_datalist("symbol-list"),
+
+            html.Br(),
+            html.Br(),
+            dcc.Dropdown(id='dropdown',
+            options=[{'label': 'max', 'value': 'max'},
+                    {'label': '1y', 'value': '1y'},
+                    {'label': '6mo', 'value': '6mo'},
+                    {'label': '1mo', 'value': '1mo'},
+                    {'label': '5d', 'value': '5d'}],
+                placeholder = 'max'
+                #options=[{'labels': comp['label'], 'value':comp['label']} for comp in comp_options]
+            ),
+            #html.H4('Price graph of different period', style = {'text-align': 'center', 'color':'blue','font-weight': 'bold'}),
+            # multiple line of text
         
         
-        dcc.Graph(id='mul_plot'),
+            dcc.Graph(id='mul_plot'),
         
 
-        html.Br(),
-        html.Div(id='my-output'),
+            html.Br(),
+            html.Div(id='my-output'),
 
-        # dcc.Dropdown(
-        #     options=[
-        #         dict(label="GOOG", value=0),
-        #         dict(label="AAPL", value=1),
-        #         dict(label="SPX", value=2),
-        #     ],
-        #     placeholder = "Select symbol"
-        # ),
+            # dcc.Dropdown(
+            #     options=[
+            #         dict(label="GOOG", value=0),
+            #         dict(label="AAPL", value=1),
+            #         dict(label="SPX", value=2),
+            #     ],
+            #     placeholder = "Select symbol"
+            # ),
 
 
 
-        html.Div('''
-             This app displays a graph of the entire price history of {}.'''.format(ticker),
-             style = {
-                 'width': '60%',
-                 'text-align': 'center',
-                 'margin-left': 'auto',
-                 'margin-right': 'auto',
-             }
-        ),
+            html.Div('''
+                 This app displays a graph of the entire price history of {}.'''.format(ticker),
+                 style = {
+                     'width': '60%',
+                     'text-align': 'center',
+                     'margin-left': 'auto',
+                     'margin-right': 'auto',
+                 }
+            ),
         
-        dcc.Graph(figure = fig, id="graphic"),
+            dcc.Graph(id="graphic"),
 
-        html.Br(),
-        dcc.Graph(figure = fig2, id="bar")
+            html.Br(),
+            dcc.Graph(id="bar")
         
         
-    ],  #I could also put the list comprehension here
-    style ={
-        'margin': '2em',
-        'border-radius': '1em',
-        'border-style': 'solid', 
-        'padding': '2em',
-        'background': '#ededed'
-    }
-)
-@app.callback(Output(component_id='mul_plot', component_property='figure'),
+        ],  #I could also put the list comprehension here
+        style ={
+            'margin': '2em',
+            'border-radius': '1em',
+            'border-style': 'solid', 
+            'padding': '2em',
+            'background': '#ededed'
+        }
+    )
+    return app
+
+
+def has_history(ticker):
+    # Asked by valid_ticker about well-formed symbols missing from symbols.txt
+    return not download_data(ticker).empty
+
+
+@callback(Output(component_id='my-output', component_property='children'),
+          Input(component_id="my-input", component_property="value"))
+def update_symbol_message(input_value):
+    # Says why the figures did not change for a symbol that was rejected
+    return symbol_message(input_value, exists=has_history)
+
+
+@callback(Output(component_id='mul_plot', component_property='figure'),
                 Input(component_id="my-input", component_property="value"),
                 Input(component_id='dropdown', component_property='value')
                 )
 def graph_update(input_value,dropdown_value):
-    print(dropdown_value)
-    ticker = input_value if input_value else "AAPL"
+    log.debug("graph_update period=%s", dropdown_value)
+    ticker = valid_ticker(input_value, exists=has_history)
     hist = download_data_time(ticker,dropdown_value)
-    fig = px.scatter(hist, y="Open", x='Date')
-
-    # The update_layout method allows us to give some formatting to the graph
-    fig.update_layout(
-        title_text = "Time Series Plot in a period of {} of {}".format(dropdown_value, input_value),
-        title_x = 0.5,
-        yaxis = {
-            'title': 'Price'}
-    )
+    with stage("figure", "graph_update"):
+        fig = px.scatter(hist, y="Open", x='Date')
+
+        # The update_layout method allows us to give some formatting to the graph
+        fig.update_layout(
+            title_text = "Time Series Plot in a period of {} of {}".format(dropdown_value, input_value),
+            title_x = 0.5,
+            yaxis = {
+                'title': 'Price'}
+        )
     
     return fig 
 
-@app.callback(
+@callback(
     Output(component_id="graphic", component_property="figure"),
     Output(component_id="bar", component_property="figure"),
     Input(component_id="my-input", component_property="value")
 )
 def update_output_div(input_value):
     # return f'Output: {input_value}'
-    ticker = input_value if input_value else "AAPL"
+    ticker = valid_ticker(input_value, exists=has_history)
     hist = download_data(ticker)
     #%% Graph generation
-    fig = px.scatter(hist, y="Open", x='Date')
-
-    # The update_layout method allows us to give some formatting to the graph
-    fig.update_layout(
-        title_text = "Time Series Plot of {}".format(ticker),
-        title_x = 0.5,
-        yaxis = {
-            'title': 'Price'}
-    )
-
-    hist["returns"] = hist["Close"].pct_change()
-    hist.dropna(inplace=True)
+    with stage("figure", "update_output_div"):
+        fig = px.scatter(hist, y="Open", x='Date')
+
+        # The update_layout method allows us to give some formatting to the graph
+        fig.update_layout(
+            title_text = "Time Series Plot of {}".format(ticker),
+            title_x = 0.5,
+            yaxis = {
+                'title': 'Price'}
+        )
 
-    hist["labels"] = pd.qcut(hist["Volume"], 20)
-    returns_mean = hist.groupby("labels")["returns"].mean()
+        stats = volume_bucket_stats(ticker, hist)
 
-    data = []
-    data.append(
-        go.Bar(
-        name = "returns distribution",
-        x = [f"{round(x.left, -len(str(x.left))+4)}-{round(x.right, -len(str(x.right))+4)}" for x in returns_mean.index.categories],
-        y = returns_mean.tolist()
+        data = []
+        data.append(
+            go.Bar(
+            name = "returns distribution",
+            x = stats["label"].tolist(),
+            y = stats["mean"].tolist()
+            )
         )
-    )
-    fig2 = make_barchart(data)
-    # Add range slider
-    fig.update_layout(
-        xaxis=dict(
-            rangeselector=dict(
-                buttons=list([
-                    dict(count=1,
-                        label="1m",
-                        step="month",
-                        # stepmode="backward"
-                        ),
-                    dict(count=6,
-                        label="6m",
-                        step="month",
-                        # stepmode="backward"
-                        ),
-                    dict(count=1,
-                        label="YTD",
-                        step="year",
-                        # stepmode="todate"
-                        ),
-                    dict(count=1,
-                        label="1y",
-                        step="year",
-                        # stepmode="backward"
-                        ),
-                    dict(step="all")
-                ])
-            ),
-            rangeslider=dict(
-                visible=True
-            ),
-            type="date",
-            title='This is a date'
+        fig2 = make_barchart(data)
+        # Add range slider
+        fig.update_layout(
+            xaxis=dict(
+                rangeselector=dict(
+                    buttons=list([
+                        dict(count=1,
+                            label="1m",
+                            step="month",
+                            # stepmode="backward"
+                            ),
+                        dict(count=6,
+                            label="6m",
+                            step="month",
+                            # stepmode="backward"
+                            ),
+                        dict(count=1,
+                            label="YTD",
+                            step="year",
+                            # stepmode="todate"
+                            ),
+                        dict(count=1,
+                            label="1y",
+                            step="year",
+                            # stepmode="backward"
+                            ),
+                        dict(step="all")
+                    ])
+                ),
+                rangeslider=dict(
+                    visible=True
+                ),
+                type="date",
+                title='This is a date'
+            )
         )
-    )
     return fig, fig2
 
 
 
-print('About to start...')
-                
-app.run_server(
-    debug = True,
-    port = 8061
-)
+if __name__ == "__main__":
+    logging.basicConfig(level = logging.INFO)
+    log.info("About to start...")
+    app = create_app()
+
+    app.run_server(
+        debug = True,
+        port = 8061
+    )
 
 
-_# %%
+# %%
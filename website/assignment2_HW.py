@@ -1,169 +1,202 @@
 
-import dash
-import pandas as pd
-import yfinance as yf
-import plotly.express as px
 import plotly.graph_objects as go
-from dash import Dash, html, dcc, Input, Output
-import numpy as np
+from dash import Dash, html, dcc, callback, Input, Output, State, Patch, no_update
+import os
 
-#%% Data Download Section
+from cache import ttl_cache
+from data_store import MultiTickerLoader, default_store
+from fetch_pool import pool_from_env
+from market import market_ttl
+from symbols import symbol_datalist, symbol_index
 
+#%% Data Download Section
 
-def download_data(ticker):
-    myTicker = yf.Ticker(ticker)
-    hist = myTicker.history(period="max")
-    hist = hist.reset_index()
-    hist['Date'] = pd.to_datetime(hist['Date'], errors = 'coerce')
-    return hist
+# Series are reloaded once market_ttl has passed, picking up the newest bars
+loader = MultiTickerLoader(default_store(), ttl = market_ttl)
+fetch_pool = pool_from_env()
 
 
 def download_data_list(ticker_list):
-    ticker_string = ', '.join(ticker_list)
-    myTicker = yf.Tickers(ticker_string)
-    hist = myTicker.history(period="max")
-    return hist
-
-
-ticker_list = ["AAPL", "MSFT"]
-hist_list = download_data_list(ticker_list)
-fig1 = go.Figure()
-df_new = hist_list['Close'][['AAPL']].dropna()
-fig1.add_trace(go.Scatter(y=df_new['AAPL'].to_list(), x=df_new.index.to_list()))
-df_new = hist_list['Close'][['MSFT']].dropna()
-fig1.add_trace(go.Scatter(y=df_new['MSFT'].to_list(), x=df_new.index.to_list()))
-names_list = ticker_list.copy()
-fig1.for_each_trace(lambda t: t.update(name=names_list.pop(0)))
-
-# I can call the update method enbedded in plotly express:
-fig1.update_layout(
-    # this is a function taking multiple kwargs where complex args have to be passed as dictionaries
-    title = {
-        'text': 'American Airlines Historical Price',
-        'y': 0.95,
-        'x': 0.5,
-        'font': {'size': 22}
-    },
-    paper_bgcolor = 'white',
-    plot_bgcolor = 'white',
-    autosize = False,
-    height = 400,
-    xaxis = {
-        'title': 'Closing Date',
-        'showline': True,
-        'linewidth': 1,
-        'linecolor': 'black'
-    },
-    yaxis = {
-        'showline': True,
-        'linewidth': 1,
-        'linecolor': 'black'
-    }
-)
+    # Closing prices, one column per ticker on a shared date index; only tickers
+    # not loaded before are downloaded, together in one batched call
+    # The loader's own series stay behind its lock; callers get a new frame
+    return fetch_pool.call(loader.load, tuple(ticker_list))
+
+
+DEFAULT_TICKERS = ("AAPL", "MSFT")
+# Each browser tab compares its own tickers, at most MAX_TICKERS of them; the
+# list lives in the page (the "tickers" store), so any worker can answer it
+MAX_TICKERS = int(os.environ.get("MAX_COMPARE_TICKERS", 10))
+
+
+def price_trace(hist_list, ticker):
+    df_new = hist_list[[ticker]].dropna()
+    return go.Scatter(y=df_new[ticker].to_list(), x=df_new.index.to_list(), name=ticker)
+
+
+@ttl_cache(maxsize=1, ttl=market_ttl)
+def default_figure():
+    # Rebuilt when the market data is due for a refresh, never modified in
+    # between; pages only append traces to their own copy in the browser
+    hist_list = download_data_list(DEFAULT_TICKERS)
+    fig1 = go.Figure()
+    for ticker in DEFAULT_TICKERS:
+        fig1.add_trace(price_trace(hist_list, ticker))
+
+    # I can call the update method enbedded in plotly express:
+    fig1.update_layout(
+        # this is a function taking multiple kwargs where complex args have to be passed as dictionaries
+        title = {
+            'text': 'American Airlines Historical Price',
+            'y': 0.95,
+            'x': 0.5,
+            'font': {'size': 22}
+        },
+        paper_bgcolor = 'white',
+        plot_bgcolor = 'white',
+        autosize = False,
+        height = 400,
+        xaxis = {
+            'title': 'Closing Date',
+            'showline': True,
+            'linewidth': 1,
+            'linecolor': 'black'
+        },
+        yaxis = {
+            'showline': True,
+            'linewidth': 1,
+            'linecolor': 'black'
+        }
+    )
 
-# This updates the data portion
-fig1.update_layout(
-    xaxis=dict(
-        rangeselector = dict(
-            buttons = list([
-                dict(count=1,
-                     label="1m",
-                     step="month",
-                     # stepmode="backward"
-                     ),
-                dict(count=6,
-                     label="6m",
-                     step="month",
-                     # stepmode="backward"
-                     ),
-                dict(count=1,
-                     label="YTD",
-                     step="year",
-                     # stepmode="todate"
-                     ),
-                dict(count=1,
-                     label="1y",
-                     step="year",
-                     # stepmode="backward"
-                     ),
-                dict(step="all")
-            ])
-        ),
-        rangeslider=dict(
-            visible=True
-        ),
-        type="date",
+    # This updates the data portion
+    fig1.update_layout(
+        xaxis=dict(
+            rangeselector = dict(
+                buttons = list([
+                    dict(count=1,
+                         label="1m",
+                         step="month",
+                         # stepmode="backward"
+                         ),
+                    dict(count=6,
+                         label="6m",
+                         step="month",
+                         # stepmode="backward"
+                         ),
+                    dict(count=1,
+                         label="YTD",
+                         step="year",
+                         # stepmode="todate"
+                         ),
+                    dict(count=1,
+                         label="1y",
+                         step="year",
+                         # stepmode="backward"
+                         ),
+                    dict(step="all")
+                ])
+            ),
+            rangeslider=dict(
+                visible=True
+            ),
+            type="date",
+        )
     )
-)
+    return fig1
 
 
 #%% Dash app
-app = Dash()
-
-app.layout = html.Div(
-    [
-        "See how it will be displayed",
-        html.Center(html.H4('My Third Dash App - Woohoo!')),
-        html.Br(),
-        dcc.Input(
-            id="my-input",
-            type="text",
-            placeholder="Please input stock symbol name Default AAPL: ",
-            style={ "width": "20%"}
-        ),
-
-        html.Br(),
-        html.Div(id='my-output'),
-
-        html.Div('''
-             This app displays a graph of the entire price history of AAPL.''',
-             style = {
-                 'width': '60%',
-                 'text-align': 'center',
-                 'margin-left': 'auto',
-                 'margin-right': 'auto',
-             }
-        ),
-        
-        dcc.Graph(figure=fig1, id="graphic"),
-
-    ],  # I could also put the list comprehension here
-    style=
-    {
-        'margin': '2em',
-        'border-radius': '1em',
-        'border-style': 'solid', 
-        'padding': '2em',
-        'background': '#ededed'
-    }
-)
-
+def serve_layout():
+    # Every page load starts from the default tickers
+    return html.Div(
+        [
+            dcc.Store(id="tickers", data=list(DEFAULT_TICKERS)),
+            "See how it will be displayed",
+            html.Center(html.H4('My Third Dash App - Woohoo!')),
+            html.Br(),
+            dcc.Input(
+                id="my-input",
+                type="text",
+                placeholder="Please input stock symbol name Default AAPL: ",
+                style={ "width": "20%"},
+                debounce=True,
+                list="symbol-list"
+            ),
+            symbol_datalist("symbol-list"),
+
+            html.Br(),
+            html.Div(id='my-output'),
+
+            html.Div('''
+                 This app displays a graph of the entire price history of AAPL.''',
+                 style = {
+                     'width': '60%',
+                     'text-align': 'center',
+                     'margin-left': 'auto',
+                     'margin-right': 'auto',
+                 }
+            ),
+            
+            dcc.Graph(figure=default_figure(), id="graphic"),
+
+        ],  # I could also put the list comprehension here
+        style=
+        {
+            'margin': '2em',
+            'border-radius': '1em',
+            'border-style': 'solid', 
+            'padding': '2em',
+            'background': '#ededed'
+        }
+    )
 
-@app.callback(
-    Output(component_id="graphic", component_property="figure"),
-    Input(component_id="my-input", component_property="value")
-)
-def update_output_div(input_value):
-    # return f'Output: {input_value}
-    if input_value and len(input_value) == 4 and input_value not in ticker_list:
-        ticker_list.append(input_value)
-        print(ticker_list)
-        hist_list = download_data_list(ticker_list)
-        # Graph generation
-        df_new = hist_list["Close"][[ticker_list[-1]]].dropna()
-        fig1.add_trace(go.Scatter(y=df_new[ticker_list[-1]].to_list(), x=df_new.index.to_list()))
-        names_list = ticker_list.copy()
-        fig1.for_each_trace(lambda t: t.update(name=names_list.pop(0)))
 
-    return fig1
+def create_app():
+    app = Dash(__name__)
+    app.layout = serve_layout
+    return app
 
 
-print('About to start...')
-                
-app.run_server(
-    debug=True,
-    port=8061
+@callback(
+    Output(component_id="graphic", component_property="figure"),
+    Output(component_id="my-output", component_property="children"),
+    Output(component_id="tickers", component_property="data"),
+    Input(component_id="my-input", component_property="value"),
+    State(component_id="tickers", component_property="data")
 )
+def update_output_div(input_value, tickers):
+    # return f'Output: {input_value}
+    # Only the new trace goes to the browser, appended to the figure it already has
+    # Malformed symbols are rejected before any download; well-formed ones the
+    # provider does not know end up with "No price history" below
+    if not input_value:
+        return no_update, no_update, no_update
+    tickers = list(tickers or DEFAULT_TICKERS)
+    ticker = symbol_index().normalize(input_value)
+    if ticker is None:
+        return no_update, "{} is not a ticker symbol".format(input_value.strip()), no_update
+    if ticker in tickers:
+        return no_update, no_update, no_update
+    if len(tickers) >= MAX_TICKERS:
+        return no_update, "At most {} tickers can be compared".format(MAX_TICKERS), no_update
+    # Only the new ticker is read, so the cost does not grow with the list
+    hist_list = download_data_list([ticker])
+    if ticker not in hist_list:
+        return no_update, "No price history for {}".format(ticker), no_update
+    patched = Patch()
+    patched["data"].append(price_trace(hist_list, ticker))
+    return patched, "", tickers + [ticker]
+
+
+if __name__ == "__main__":
+    print('About to start...')
+    app = create_app()
+
+    app.run_server(
+        debug=True,
+        port=8061
+    )
 
 
 # %%
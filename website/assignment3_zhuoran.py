@@ -1,289 +1,586 @@
-import dash
-import pandas as pd
-import yfinance as yf
-import plotly.express as px
-import plotly.graph_objects as go
-from dash import Dash, html, dcc, Input, Output
-import numpy as np
+import time
+STARTED = time.perf_counter() # Reference point for time-to-first-byte
+
+from dash import Dash, html, dcc, callback, clientside_callback, ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
+import os
+
+from analytics import volume_bucket_stats
+from cache import cache_stats, configure_shared_cache, ttl_cache
+from data_store import DATA_DIR, CompactHistory, default_store, slice_period
+from downsample import downsample, relayout_window, window
+from fetch_pool import pool_from_env
+from figures import (date_array, empty_figure, figure_layout, patch_figure, plot_fan_chart, plot_paths,
+                     plot_terminal_histogram, time_series_figure, typed_array)
+from market import market_ttl, market_window
+from metrics import install_metrics, metrics, timed
+from models import MODELS, fit_model
+from prefetch import AccessStats, RefreshLock, WarmupScheduler
+from return_stats import ReturnStatsStore
+from server_timing import install_timing
+from shared_cache import backend_from_url
+from simulation import MAX_ELEMENTS, reporting_progress, simulate_paths, simulate_summary
+from singleflight import flight_stats, single_flight
+from symbols import symbol_datalist, symbol_message, valid_ticker
+
+
+# Full histories are kept on disk and only topped up with the latest bars
+store = default_store()
+COMPACT_HISTORY = os.environ.get("COMPACT_HISTORY", "1") != "0"
+history_memory = CompactHistory() # history_memory.report() gives the bytes held per ticker
+return_stats = ReturnStatsStore(os.path.join(DATA_DIR, "stats"))
+fetch_pool = pool_from_env()
+# Processes used by simulations larger than one chunk
+SIM_WORKERS = int(os.environ.get("SIM_WORKERS", os.cpu_count() or 1))
+# (model, days, trials, seed) of the initial simulation figures
+SIM_DEFAULTS = ("gbm", 30, 10000, None)
+
+# Share downloads and figures between worker processes, e.g.
+# DASH_CACHE_URL=sqlite:///website/data/cache.db or redis://localhost:6379/0
+configure_shared_cache(backend_from_url(os.environ.get("DASH_CACHE_URL")))
+
+# Points per time series figure; zooming in re-requests the visible window
+MAX_POINTS = int(os.environ.get("MAX_POINTS", 2000))
+# Period changes and zooming answered in the browser from one shipped series
+# (assets/timeseries.js); CLIENTSIDE_PERIODS=0 renders them on the server instead
+CLIENTSIDE_PERIODS = os.environ.get("CLIENTSIDE_PERIODS", "1") != "0"
+
+
+def background_manager():
+    # Simulations run as background jobs in their own processes, with results kept
+    # in DATA_DIR/jobs; BACKGROUND_CALLBACKS=0 or a missing dash[diskcache] runs
+    # them inside the request instead
+    if os.environ.get("BACKGROUND_CALLBACKS", "1") == "0":
+        return None
+    try:
+        import diskcache
+        from dash import DiskcacheManager
+        return DiskcacheManager(diskcache.Cache(os.path.join(DATA_DIR, "jobs")),
+                                # Results expire with the market window and whenever a
+                                # history is rewritten, e.g. by the closing-bar refresh
+                                cache_by = [market_window, store.generation],
+                                expire = int(os.environ.get("JOB_CACHE_EXPIRE", 86400)))
+    except ImportError:
+        return None
+
+
+background = background_manager()
+
+
+def history_version(ticker=None, *args, **kwargs):
+    # mtime of the ticker's file: results derived from its bars are keyed by it, so
+    # a refresh in any worker re-keys them everywhere, shared cache included
+    return store.version(ticker or "AAPL")
+
+
+def load_history(ticker):
+    # float32 prices, no all-zero columns, shared dates; COMPACT_HISTORY=0 keeps the full frame
+    hist = store.load(ticker)
+    return history_memory.compact(ticker, hist) if COMPACT_HISTORY else hist
+
+
+@ttl_cache(maxsize=64, ttl=market_ttl, max_bytes=512 * 2**20, shared=True, version=history_version) # Download data from yahoo finance
+@single_flight # Concurrent callbacks asking for the same ticker share one fetch
+@timed("download")
+def download_history(ticker):
+    # Runs on the fetch pool: timeouts, retries, and the last good copy on failure
+    return fetch_pool.call(load_history, ticker)
 
-from memoization import cached
 
-
-@cached # Download data from yahoo finance
 def download_data(ticker, period="max"):
-    myTicker = yf.Ticker(ticker)
-    hist = myTicker.history(period=period).reset_index()
-    hist['Date'] = pd.to_datetime(hist['Date'], errors = 'coerce')
-    return hist
+    # Every period is a date slice of the one cached full history; the provider is
+    # only asked again once that history has expired from the cache
+    return slice_period(download_history(ticker), period)
+
 
+def time_series_title(ticker, period="max"):
+    return "Time Series Plot of {}".format(ticker) if period == "all" \
+        else "Time Series Plot in a period of {} of {}".format(period, ticker)
 
-@cached # Plot time series of the ticker
-def plot_time_series(ticker, period="max"):
+
+@ttl_cache(maxsize=128, ttl=market_ttl, max_bytes=256 * 2**20, shared=True, version=history_version) # Plot time series of the ticker
+@timed("figure")
+def plot_time_series(ticker, period="max", x_range=None, max_points=MAX_POINTS):
     ticker = ticker if ticker else "AAPL"
     hist = download_data(ticker, period)
-    fig = px.scatter(hist, y="Open", x='Date')
-
-    # The update_layout method allows us to give some formatting to the graph
-    fig.update_layout(
-        title_text = "Time Series Plot of {}".format(ticker) if period == "all" \
-            else "Time Series Plot in a period of {} of {}".format(period, ticker),
-        title_x = 0.5,
-        yaxis = {
-            'title': 'Price'}
-    )
-    
-    # Add range slider
-    fig.update_layout(
-        xaxis=dict(
-            rangeselector=dict(
-                buttons=list([
-                    dict(count=1,
-                        label="1m",
-                        step="month",
-                        # stepmode="backward"
-                        ),
-                    dict(count=6,
-                        label="6m",
-                        step="month",
-                        # stepmode="backward"
-                        ),
-                    dict(count=1,
-                        label="YTD",
-                        step="year",
-                        # stepmode="todate"
-                        ),
-                    dict(count=1,
-                        label="1y",
-                        step="year",
-                        # stepmode="backward"
-                        ),
-                    dict(step="all")
-                ])
-            ),
-            rangeslider=dict(
-                visible=False
-            ),
-            # type="date",
-            # title='This is a date'
-        )
+    # Only the visible window at full resolution, thinned to max_points bars
+    if x_range is not None:
+        hist = window(hist, *x_range)
+    hist = downsample(hist, "Open", max_points)
+    # Dict figure on the prebuilt layout, with the points as typed arrays
+    if x_range is not None:
+        xaxis = dict(range = list(x_range), autorange = False)
+    else:
+        xaxis = dict(autorange = True)
+    return time_series_figure(hist["Date"], hist["Open"].to_numpy(), time_series_title(ticker, period),
+                              xaxis = xaxis, uirevision = ticker)
+
+
+@ttl_cache(maxsize=128, ttl=market_ttl, max_bytes=256 * 2**20, shared=True, version=history_version)
+@timed("figure")
+def series_payload(ticker):
+    # The full Open series as typed arrays plus the figure layout, for the
+    # clientside callbacks. Dates are wall-clock milliseconds, as plotly shows them.
+    hist = download_data(ticker)
+    return dict(
+        ticker = ticker,
+        version = data_version(hist),
+        max_points = MAX_POINTS,
+        x = date_array(hist["Date"]),
+        y = typed_array(hist["Open"], "f4"),
+        layout = figure_layout("time_series", time_series_title(ticker, "{period}")),
     )
-    return fig 
 
 
-@cached
-def calculate_volatility(ticker):
-    hist = download_data(ticker)
-    hist["returns"] = hist["Close"].pct_change()
-    hist.dropna(inplace=True)
-
-    hist["labels"] = pd.qcut(hist["Volume"], 20)
-    returns_mean = hist.groupby("labels")["returns"].mean()
+@ttl_cache(maxsize=64, ttl=market_ttl, version=history_version)
+@timed("compute")
+def calculate_volatility(ticker, buckets=20):
+    # Mean return per volume bucket; the cached history is left untouched
+    stats = volume_bucket_stats(ticker, download_data(ticker), buckets)
 
     data = []
     data.append(
-        go.Bar(
+        dict(
+        type = "bar",
         name = "returns distribution",
-        x = [f"{round(x.left, -len(str(x.left))+4)}-{round(x.right, -len(str(x.right))+4)}" for x in returns_mean.index.categories],
-        y = returns_mean.tolist()
+        x = stats["label"].tolist(),
+        y = typed_array(stats["mean"]),
+        customdata = stats[["count", "std"]].to_numpy().tolist(),
+        hovertemplate = "%{x}<br>mean %{y:.4%}<br>std %{customdata[1]:.4%}<br>%{customdata[0]} days<extra></extra>"
         )
     )
     return data
 
 
-@cached
+@ttl_cache(maxsize=64, ttl=market_ttl, shared=True)
+@timed("figure")
 def make_barchart(data):
-    fig = go.Figure(data = data)
-
-    fig.update_layout(
-        barmode = 'group',
-        title = 'Bar Chart of Equity Returns grouped by Volume',
-        paper_bgcolor = 'white',
-        plot_bgcolor = 'white',
-        xaxis = dict(
-            showline = True, 
-            linewidth = 2, 
-            linecolor = 'black'
-        ),
-        yaxis=dict(
-            title = 'Stock Returns',
-            titlefont_size = 16,
-            tickfont_size = 14,
-            gridcolor = '#dfe5ed'
-        )
-    )
+    # The bars on the prebuilt bar chart layout
+    return dict(data = list(data), layout = figure_layout("barchart"))
+
+def data_version(hist):
+    # Identifies the bars a result was computed from; part of the simulation keys
+    last = hist.iloc[-1]
+    return "{}:{}:{}".format(len(hist), last["Date"].isoformat(), last["Close"])
+
+
+@ttl_cache(maxsize=64, ttl=market_ttl)
+@timed("compute")
+def simulation_model(ticker, model="gbm", version=None):
+    # Starting price and fitted model; refitted whenever the history changes
+    stats = return_stats.get(ticker, download_data(ticker))
+    return stats["Close"].iloc[-1], fit_model(model, stats)
+
+
+@ttl_cache(maxsize=32, ttl=market_ttl, max_bytes=256 * 2**20)
+@timed("compute")
+def calculate_simulation(ticker, model="gbm", days=30, trials=100, seed=None, version=None):
+    s0, fitted = simulation_model(ticker, model, version)
+    return simulate_paths(s0, fitted, days, trials, seed)
+
+
+@ttl_cache(maxsize=32, ttl=market_ttl, max_bytes=256 * 2**20)
+@timed("compute")
+def calculate_simulation_summary(ticker, model="gbm", days=30, trials=10000, seed=None, sample=0, version=None):
+    # Percentile bands, terminal distribution and VaR/CVaR without keeping the paths
+    s0, fitted = simulation_model(ticker, model, version)
+    return simulate_summary(s0, fitted, days, trials, seed, sample=sample, workers=SIM_WORKERS)
+
+@ttl_cache(maxsize=32, ttl=market_ttl, max_bytes=256 * 2**20, shared=True)
+@timed("figure")
+def plot_simulation(input_value, model="gbm", days=30, trials=10000, seed=None, version=None, mode="fan", sample=20):
+    # "fan" draws percentile bands plus a few sample paths, so the payload does not
+    # grow with the trial count; "paths" draws every path as its own trace.
+    # version (see data_version) keys the result to the bars it was computed from.
+    if mode == "paths":
+        return plot_simulation_paths(input_value, model, days, trials, seed, version)
+    summary = calculate_simulation_summary(input_value, model, days, trials, seed, sample, version)
+    fig = plot_fan_chart(summary, "{} simulation of {}".format(MODELS[model].label, input_value))
+    histog = plot_terminal_histogram(
+        summary["terminal"],
+        "Distribution of prices in {}days of Monte Carlo simulation of {}".format(days, input_value))
+    return fig, histog
 
-    fig.layout.hovermode = 'x'
-    return(fig)
 
-@cached
-def calculate_simulation(ticker,days=30, trials=100):
-    hist = download_data(ticker)
-    from scipy.stats import norm
-    data=hist["Close"].pct_change()
-    log_returns = np.log(1 + data)
-    u = log_returns.mean()
-    var = log_returns.var()
-    drift = u - (0.5*var)
-    stdev = log_returns.std()
-
-    # Z = norm.ppf(np.random.rand(days, trials)) #days, trials
-    Z = np.random.randn(days, trials)
-    daily_returns = np.exp(drift + stdev * Z)
-    price_paths = np.zeros_like(daily_returns)
-    price_paths[0] = hist["Close"].iloc[-1]
-    for t in range(1, days):
-        price_paths[t] = price_paths[t-1]*daily_returns[t]
-
-    price_paths=price_paths.T
-    data2 = []
-    last=[]
-    for path in price_paths:
-        last.append(path[-1])
-        data2.append(
-            go.Scatter
-            (
-            y = [i for i in path],
-            x = [i for i in range(days)]
-            )
-        )
-    
-    return data2, last
-
-@cached
-def plot_simulation(input_value):
-    data, last = calculate_simulation(input_value)
-    fig = go.Figure(data = data)
-    import plotly.express as px
-    histog = px.histogram(last)
-    fig.update_layout(
-        title_text = "Monte Carlo simulation of {}".format(input_value),
-        title_x = 0.5,
-        yaxis = {
-            'title': 'Price'}
-    )
-    histog.update_layout(
-        title_text = "Distribution of prices in 30days of Monte Carlo simulation of {}".format(input_value),
-        title_x = 0.5,
-        yaxis = {
-            'title': 'Price'}
-    )
+@timed("figure")
+def plot_simulation_paths(input_value, model="gbm", days=30, trials=100, seed=None, version=None):
+    # Every path, packed into one trace, and the histogram of the final prices
+    price_paths = calculate_simulation(input_value, model, days, trials, seed, version)
+    fig = plot_paths(price_paths, "{} simulation of {}".format(MODELS[model].label, input_value))
+    histog = plot_terminal_histogram(
+        price_paths[:, -1],
+        "Distribution of prices in {}days of Monte Carlo simulation of {}".format(days, input_value))
     return fig, histog
 
-
-ticker = "AAPL"
-hist = download_data(ticker)
-fig_time_series = plot_time_series(ticker)
-fig_time_series_period = plot_time_series(ticker, "1y")
-fig_volatility = make_barchart(calculate_volatility(ticker))
-figure_simulation, figure_simulation_histogram = plot_simulation(ticker)
+def initial_figures(ticker="AAPL"):
+    # Figures for a new page: whatever is already cached, placeholders for the
+    # rest. The startup interval then fills the placeholders in.
+    hist = download_history.cache_get(ticker)
+    simulation = (hist is not None and plot_simulation.cache_get(ticker, *SIM_DEFAULTS, version=data_version(hist))) or (
+        empty_figure("GBM simulation of {}".format(ticker), "Days", "Price"),
+        empty_figure("Distribution of prices in 30days of Monte Carlo simulation of {}".format(ticker), "Price", "Count"))
+    volatility = calculate_volatility.cache_get(ticker)
+    bar = make_barchart.cache_get(volatility) if volatility is not None else None
+    return dict(
+        sim_plot = simulation[0],
+        sim_hist = simulation[1],
+        mul_plot = plot_time_series.cache_get(ticker, "1y") or \
+            dict(data = [], layout = figure_layout("time_series", time_series_title(ticker, "1y"))),
+        graphic = plot_time_series.cache_get(ticker) or \
+            dict(data = [], layout = figure_layout("time_series", time_series_title(ticker))),
+        bar = bar or make_barchart([]),
+    )
 
 
 #%% Dash app
-app = Dash(
-    prevent_initial_callbacks = True
-)
-
-app.layout = html.Div(
-    [
-        "See how it will be displayed",
-        html.Center(html.H4('My Second Dash App - Yey!!!')),
-        html.Br(),
-        html.Br(),
-
-        dcc.Input(
-            id="my-input",
-            type="text",
-            placeholder="Please input stock symbol name Default AAPL: ",
-            style={ "width": "20%"}
-        ),
-        dcc.Graph(id='sim_plot', figure=figure_simulation),
-        dcc.Graph(id='sim_hist', figure=figure_simulation_histogram),
+def serve_layout():
+    # Called on every page load, so a new visitor gets whatever is cached by then
+    figures = initial_figures()
+    return html.Div(
+        [
+            # Fires once right after the page renders and fills in the figures
+            dcc.Interval(id="startup", interval=100, max_intervals=1),
+            dcc.Store(id="series-store"),
+            "See how it will be displayed",
+            html.Center(html.H4('My Second Dash App - Yey!!!')),
+            html.Br(),
+            html.Br(),
+
+            dcc.Input(
+                id="my-input",
+                type="text",
+                placeholder="Please input stock symbol name Default AAPL: ",
+                style={ "width": "20%"},
+                # Only fire on Enter or blur, not on every keystroke
+                debounce=True,
+                list="symbol-list"
+            ),
+            symbol_datalist("symbol-list"),
+            html.Div(
+                [
+                    dcc.Dropdown(id='sim-model',
+                        options=[{'label': cls.label, 'value': name} for name, cls in MODELS.items()],
+                        value=SIM_DEFAULTS[0],
+                        clearable=False,
+                        style={'width': '12em'}),
+                    " days ",
+                    dcc.Input(id='sim-days', type='number', min=2, max=756, step=1,
+                              value=SIM_DEFAULTS[1], debounce=True),
+                    " trials ",
+                    dcc.Input(id='sim-trials', type='number', min=100, max=1000000, step=100,
+                              value=SIM_DEFAULTS[2], debounce=True),
+                    " seed ",
+                    dcc.Input(id='sim-seed', type='number', min=0, step=1, placeholder='random',
+                              value=SIM_DEFAULTS[3], debounce=True),
+                    # Filled in while a background simulation runs
+                    html.Progress(id='sim-progress', value=0, max=1, style={'visibility': 'hidden'}),
+                ],
+                style={'display': 'flex', 'align-items': 'center', 'gap': '0.5em', 'margin-top': '1em'}
+            ),
+            dcc.Graph(id='sim_plot', figure=figures['sim_plot']),
+            dcc.Graph(id='sim_hist', figure=figures['sim_hist']),
         
-        html.Br(),
-        html.Br(),
-        dcc.Dropdown(id='dropdown',
-        options=[{'label': 'max', 'value': 'max'},
-                {'label': '1y', 'value': '1y'},
-                {'label': '6mo', 'value': '6mo'},
-                {'label': '1mo', 'value': '1mo'},
-                {'label': '5d', 'value': '5d'}],
-            placeholder = 'max'
-            #options=[{'labels': comp['label'], 'value':comp['label']} for comp in comp_options]
-        ),
-        #html.H4('Price graph of different period', style = {'text-align': 'center', 'color':'blue','font-weight': 'bold'}),
-        # multiple line of text
+            html.Br(),
+            html.Br(),
+            dcc.Dropdown(id='dropdown',
+            options=[{'label': 'max', 'value': 'max'},
+                    {'label': '1y', 'value': '1y'},
+                    {'label': '6mo', 'value': '6mo'},
+                    {'label': '1mo', 'value': '1mo'},
+                    {'label': '5d', 'value': '5d'}],
+                value = '1y', # the period of the initial mul_plot figure
+                placeholder = 'max'
+                #options=[{'labels': comp['label'], 'value':comp['label']} for comp in comp_options]
+            ),
+            #html.H4('Price graph of different period', style = {'text-align': 'center', 'color':'blue','font-weight': 'bold'}),
+            # multiple line of text
         
         
-        dcc.Graph(id='mul_plot', figure=fig_time_series_period),
+            dcc.Graph(id='mul_plot', figure=figures['mul_plot']),
         
 
-        html.Br(),
-        html.Div(id='my-output'),
-
-        # dcc.Dropdown(
-        #     options=[
-        #         dict(label="GOOG", value=0),
-        #         dict(label="AAPL", value=1),
-        #         dict(label="SPX", value=2),
-        #     ],
-        #     placeholder = "Select symbol"
-        # ),
-
-        html.Div('''
-             This app displays a graph of the entire price history of {}.'''.format(ticker),
-             style = {
-                 'width': '60%',
-                 'text-align': 'center',
-                 'margin-left': 'auto',
-                 'margin-right': 'auto',
-             }
-        ),
+            html.Br(),
+            html.Div(id='my-output'),
+
+            # dcc.Dropdown(
+            #     options=[
+            #         dict(label="GOOG", value=0),
+            #         dict(label="AAPL", value=1),
+            #         dict(label="SPX", value=2),
+            #     ],
+            #     placeholder = "Select symbol"
+            # ),
+
+            html.Div('''
+                 This app displays a graph of the entire price history of {}.'''.format("AAPL"),
+                 style = {
+                     'width': '60%',
+                     'text-align': 'center',
+                     'margin-left': 'auto',
+                     'margin-right': 'auto',
+                 }
+            ),
         
-        dcc.Graph(figure = fig_time_series, id="graphic"),
+            dcc.Graph(figure = figures['graphic'], id="graphic"),
 
-        html.Br(),
-        dcc.Graph(figure = fig_volatility, id="bar")
+            html.Br(),
+            dcc.Graph(figure = figures['bar'], id="bar")
         
         
-    ],  #I could also put the list comprehension here
-    style ={
-        'margin': '2em',
-        'border-radius': '1em',
-        'border-style': 'solid', 
-        'padding': '2em',
-        'background': '#ededed'
-    }
-)
+        ],  #I could also put the list comprehension here
+        style ={
+            'margin': '2em',
+            'border-radius': '1em',
+            'border-style': 'solid', 
+            'padding': '2em',
+            'background': '#ededed'
+        }
+    )
 
-@app.callback(Output(component_id='sim_plot', component_property='figure'),
-              Output(component_id='sim_hist', component_property='figure'),
-                Input(component_id="my-input", component_property="value")
-                )
-def update_simulation(input_value="AAPL"):
-    return plot_simulation(input_value)
 
+def has_history(ticker):
+    # Asked by valid_ticker about well-formed symbols missing from symbols.txt
+    return not download_history(ticker).empty
+
+
+@callback(Output(component_id='my-output', component_property='children'),
+          Input(component_id="my-input", component_property="value"))
+def update_symbol_message(input_value):
+    # Says why the figures did not change for a symbol that was rejected
+    return symbol_message(input_value, exists=has_history)
+
+
+
+# Callbacks send Patches: the new traces and titles, never the whole layout
+TIME_SERIES_KEYS = ("title", "uirevision", "xaxis.range", "xaxis.autorange")
+
+
+def simulation_figures(input_value="AAPL", model=None, days=None, trials=None, seed=None):
+    ticker = valid_ticker(input_value, exists=has_history)
+    model = model if model in MODELS else SIM_DEFAULTS[0]
+    # Out-of-range or cleared inputs fall back to the defaults / nearest bound
+    days = min(max(int(days or SIM_DEFAULTS[1]), 2), 756)
+    trials = min(max(int(trials or SIM_DEFAULTS[2]), 100), 1000000)
+    # trials * days is capped too, so long horizons get fewer trials
+    trials = max(min(trials, MAX_ELEMENTS // days // 100 * 100), 100)
+    seed = int(seed) if seed is not None else None
+    version = data_version(download_history(ticker))
+    fig, histog = plot_simulation(ticker, model, days, trials, seed, version=version)
+    return patch_figure(fig), patch_figure(histog, ("title", "bargap"))
+
+
+SIMULATION_CALLBACK = [
+    Output(component_id='sim_plot', component_property='figure'),
+    Output(component_id='sim_hist', component_property='figure'),
+    Input(component_id="my-input", component_property="value"),
+    Input(component_id="startup", component_property="n_intervals"),
+    Input(component_id="sim-model", component_property="value"),
+    Input(component_id="sim-days", component_property="value"),
+    Input(component_id="sim-trials", component_property="value"),
+    Input(component_id="sim-seed", component_property="value"),
+]
+
+if background is not None:
+    # Runs in a job process; the page polls every 250ms for progress and the result.
+    # A newer input makes the page cancel the job it supersedes (Dash's oldJob),
+    # and results are cached on disk per ticker/model/days/trials/seed, market
+    # window and data generation, so a repeated request is answered by the first poll.
+    @callback(
+        *SIMULATION_CALLBACK,
+        background = True,
+        manager = background,
+        interval = 250,
+        progress = [Output("sim-progress", "value"), Output("sim-progress", "max")],
+        running = [(Output("sim-progress", "style"), {"visibility": "visible"}, {"visibility": "hidden"})],
+        cache_args_to_ignore = [1], # the startup tick
+    )
+    def update_simulation(set_progress, input_value="AAPL", startup=None, model=None, days=None, trials=None, seed=None):
+        try:
+            with reporting_progress(lambda done, total: set_progress((done, total))):
+                return simulation_figures(input_value, model, days, trials, seed)
+        finally:
+            forward_job_metrics()
+else:
+    @callback(*SIMULATION_CALLBACK)
+    def update_simulation(input_value="AAPL", startup=None, model=None, days=None, trials=None, seed=None):
+        return simulation_figures(input_value, model, days, trials, seed)
+
+
+def zoom_time_series(relayout_data, ticker, period="max"):
+    x_range = relayout_window(relayout_data)
+    if x_range is False:
+        raise PreventUpdate
+    fig = plot_time_series(valid_ticker(ticker, exists=has_history), period or "max", x_range)
+    return patch_figure(fig, TIME_SERIES_KEYS)
+
+
+if CLIENTSIDE_PERIODS:
+    @callback(
+        Output(component_id="series-store", component_property="data"),
+        Output(component_id="bar", component_property="figure"),
+        Input(component_id="my-input", component_property="value"),
+        Input(component_id="startup", component_property="n_intervals")
+    )
+    def update_time_series(ticker="AAPL", startup=None):
+        # The only server work for the time series graphs: one payload per ticker
+        ticker = valid_ticker(ticker, exists=has_history)
+        access_stats.record(ticker)
+        fig_volatility = make_barchart(calculate_volatility(ticker))
+        return series_payload(ticker), patch_figure(fig_volatility)
+
+
+    clientside_callback(
+        ClientsideFunction(namespace="timeseries", function_name="period_figure"),
+        Output(component_id="mul_plot", component_property="figure"),
+        Input(component_id="dropdown", component_property="value"),
+        Input(component_id="series-store", component_property="data"),
+        Input(component_id="mul_plot", component_property="relayoutData")
+    )
 
-@app.callback(Output(component_id='mul_plot', component_property='figure'),
-                Input(component_id="my-input", component_property="value"),
-                Input(component_id='dropdown', component_property='value')
-                )
-def update_time_series_period(input_value="AAPL",dropdown_value="max"):
-    return plot_time_series(input_value,dropdown_value)
 
+    clientside_callback(
+        ClientsideFunction(namespace="timeseries", function_name="max_figure"),
+        Output(component_id="graphic", component_property="figure"),
+        Input(component_id="series-store", component_property="data"),
+        Input(component_id="graphic", component_property="relayoutData")
+    )
+
+else:
+    @callback(Output(component_id='mul_plot', component_property='figure'),
+                    Input(component_id="my-input", component_property="value"),
+                    Input(component_id='dropdown', component_property='value'),
+                    Input(component_id="startup", component_property="n_intervals")
+                    )
+    def update_time_series_period(input_value="AAPL",dropdown_value="max", startup=None):
+        return patch_figure(plot_time_series(valid_ticker(input_value, exists=has_history), dropdown_value or "max"), TIME_SERIES_KEYS)
+
+
+    @callback(
+        Output(component_id="graphic", component_property="figure"),
+        Output(component_id="bar", component_property="figure"),
+        Input(component_id="my-input", component_property="value"),
+        Input(component_id="startup", component_property="n_intervals")
+    )
+    def update_time_series(ticker="AAPL", startup=None):
+        ticker = valid_ticker(ticker, exists=has_history)
+        access_stats.record(ticker)
+        fig_time_series = plot_time_series(ticker)
+        fig_volatility = make_barchart(calculate_volatility(ticker))
+        return patch_figure(fig_time_series, TIME_SERIES_KEYS), patch_figure(fig_volatility)
+
+
+    @callback(
+        Output(component_id="graphic", component_property="figure", allow_duplicate=True),
+        Input(component_id="graphic", component_property="relayoutData"),
+        State(component_id="my-input", component_property="value"),
+        prevent_initial_call=True
+    )
+    def update_time_series_zoom(relayout_data, ticker="AAPL"):
+        return zoom_time_series(relayout_data, ticker)
+
+
+    @callback(
+        Output(component_id="mul_plot", component_property="figure", allow_duplicate=True),
+        Input(component_id="mul_plot", component_property="relayoutData"),
+        State(component_id="my-input", component_property="value"),
+        State(component_id="dropdown", component_property="value"),
+        prevent_initial_call=True
+    )
+    def update_time_series_period_zoom(relayout_data, input_value="AAPL", dropdown_value="max"):
+        return zoom_time_series(relayout_data, input_value, dropdown_value)
+
+
+#%% Background warm-up
+# Keeps WARM_TICKERS and the most requested tickers computed, and pulls the
+# closing bars once the market has closed. Runs on its own thread so the server
+# accepts requests straight away; started by the entry points (wsgi.py and
+# __main__ below), WARMUP=0 turns it off.
+access_stats = AccessStats()
+
+
+def warm_ticker(ticker):
+    if CLIENTSIDE_PERIODS:
+        series_payload(ticker)
+    else:
+        plot_time_series(ticker)
+        plot_time_series(ticker, "1y")
+    make_barchart(calculate_volatility(ticker))
+    plot_simulation(ticker, *SIM_DEFAULTS, version=data_version(download_history(ticker)))
+
+
+def refresh_history(ticker):
+    return store.load(ticker, refresh=True)
+
+
+def refresh_tickers(tickers):
+    # Rewriting a ticker's file changes history_version, so only that ticker's
+    # results (here, in the other workers and in the shared cache) are re-keyed
+    fetch_pool.gather(refresh_history, [(t,) for t in tickers])
 
-@app.callback(
-    Output(component_id="graphic", component_property="figure"),
-    Output(component_id="bar", component_property="figure"),
-    Input(component_id="my-input", component_property="value")
+
+scheduler = WarmupScheduler(
+    warm_ticker,
+    watchlist = os.environ.get("WARM_TICKERS", "AAPL").split(","),
+    stats = access_stats,
+    top_n = int(os.environ.get("WARM_TOP_N", 10)),
+    refresh = refresh_tickers,
+    # One gunicorn worker pulls the closing bars, the others only warm up
+    refresh_lock = RefreshLock(os.path.join(DATA_DIR, "refresh.lock"))
 )
-def update_time_series(ticker="AAPL"):
-    fig_time_series = plot_time_series(ticker)
-    fig_volatility = make_barchart(calculate_volatility(ticker))
-    return fig_time_series, fig_volatility
+
+
+#%% Metrics
+# Read at scrape time by /metrics, next to the callback and stage timings
+metrics.add_gauges("dash_cache", cache_stats, label = "cache")
+metrics.add_gauges("dash_flight", flight_stats, label = "function")
+metrics.add_gauges("dash_fetch_pool", fetch_pool.info)
+metrics.add_gauges("dash_history_memory", history_memory.info)
+
+
+# Stage timings of a background job are recorded in its own process; the job
+# queues them in the job cache and the next scrape merges them in
+def forward_job_metrics():
+    snapshot = metrics.export()
+    if snapshot["counters"] or snapshot["histograms"]:
+        background.handle.push(snapshot, prefix = "metrics", expire = 3600)
+
+
+def collect_job_metrics():
+    while True:
+        key, snapshot = background.handle.pull(prefix = "metrics")
+        if key is None:
+            return
+        metrics.merge(snapshot)
+
+
+if background is not None:
+    metrics.add_collector(collect_job_metrics)
+
+
+#%% App factory
+# Importing this module downloads nothing and starts no threads: the layout is
+# built per page load from cached figures or placeholders, and the callbacks fill
+# in the rest. Only the entry points start the warm-up scheduler.
+def warmup_enabled():
+    return os.environ.get("WARMUP", "1") != "0"
+
+
+def create_app(warmup=False):
+    app = Dash(
+        __name__,
+        prevent_initial_callbacks = True
+    )
+    app.layout = serve_layout
+    app.startup_timing = install_timing(app.server, STARTED)
+    app.metrics = install_metrics(app.server)
+    if warmup:
+        scheduler.start()
+    return app
 
 
 if __name__ == "__main__":
     print('About to start...')
+    app = create_app(warmup = warmup_enabled())
                     
     app.run_server(
         debug = True,
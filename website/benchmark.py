@@ -0,0 +1,317 @@
+"""Benchmark of the dashboard pipeline: download -> compute -> render -> serialize.
+
+Runs assignment3_zhuoran's functions against an offline fixture provider
+(synthetic GBM bars, or feather files recorded by OHLCVStore with --fixtures)
+and sweeps history length, trial count and ticker count around a base case.
+Every repeat starts from empty caches. Results are written as JSON; --compare
+prints the change against an earlier run and exits with 1 on a regression.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+    python benchmark.py --serialization --output serialization.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+
+STAGES = ("download", "volatility", "simulate", "plot_simulation", "plot_time_series", "serialize")
+SEED = 1234
+
+
+#%% Fixtures
+def synthetic_history(bars, seed=0, end="2024-12-31"):
+    # Daily OHLCV bars shaped like YahooProvider's output
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=end, periods=bars, tz="America/New_York")
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, bars)))
+    open_ = close * np.exp(rng.normal(0, 0.005, bars))
+    return pd.DataFrame({
+        "Date": dates,
+        "Open": open_,
+        "High": np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, bars))),
+        "Low": np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, bars))),
+        "Close": close,
+        "Volume": rng.lognormal(16, 0.5, bars).astype(np.int64),
+        "Dividends": 0.0,
+        "Stock Splits": 0.0,
+    })
+
+
+def recorded_histories(path):
+    # {ticker: frame} from the TICKER.feather files an OHLCVStore wrote
+    from data_store import OHLCVStore
+    store = OHLCVStore(path)
+    return {name[:-len(".feather")]: store.read(name[:-len(".feather")])
+            for name in sorted(os.listdir(path))
+            if name.endswith(".feather") and name.count(".") == 1}
+
+
+def fixture_frames(recorded, bars, tickers):
+    # `tickers` histories of the last `bars` bars each
+    if recorded:
+        names = sorted(recorded)
+        return {"{}{}".format(names[i % len(names)], i // len(names) or ""): recorded[names[i % len(names)]].iloc[-bars:]
+                for i in range(tickers)}
+    return {"FIX{}".format(i): synthetic_history(bars, seed=i) for i in range(tickers)}
+
+
+def use_fixtures(m, frames):
+    # Point the dashboard's module globals at a fresh store over the fixtures
+    import analytics
+    from data_store import CompactHistory, FrameProvider, OHLCVStore
+    from return_stats import ReturnStatsStore
+    root = tempfile.mkdtemp(prefix="bench-")
+    m.store = OHLCVStore(root, FrameProvider(frames), max_age=10 ** 9)
+    m.return_stats = ReturnStatsStore(os.path.join(root, "stats"))
+    m.history_memory = CompactHistory()
+    analytics._buckets.clear() # bucket edges fitted to the previous fixtures
+
+
+#%% Pipeline
+def run_pipeline(m, tickers, days, trials, model, trace=False):
+    # One pass from empty caches; {stage: (seconds, bytes, peak traced bytes)}
+    import plotly.io as pio
+    from cache import caches, estimate_size
+    for wrapper in caches.values():
+        wrapper.cache_clear()
+
+    results = {}
+
+    def timed(stage, fn, size=estimate_size):
+        if trace:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        out = [fn(t) for t in tickers]
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - base if trace else None
+        results[stage] = (elapsed, size(out), peak)
+        return out
+
+    timed("download", m.download_data)
+    bars = timed("volatility", lambda t: m.make_barchart(m.calculate_volatility(t)))
+    versions = {t: m.data_version(m.download_history(t)) for t in tickers}
+    timed("simulate", lambda t: m.calculate_simulation_summary(t, model, days, trials, SEED, 20, versions[t]))
+    simulations = timed("plot_simulation", lambda t: m.plot_simulation(t, model, days, trials, SEED, version=versions[t]))
+    series = timed("plot_time_series", m.plot_time_series)
+
+    figures = {t: [series[i], bars[i], *simulations[i]] for i, t in enumerate(tickers)}
+    timed("serialize", lambda t: [pio.to_json(fig, validate=False) for fig in figures[t]],
+          size=lambda out: sum(len(s) for payloads in out for s in payloads))
+    return results
+
+
+def summarize(samples, peaks):
+    out = {}
+    for stage in STAGES:
+        seconds = np.array([s[stage][0] for s in samples])
+        out[stage] = dict(
+            p50 = float(np.percentile(seconds, 50)),
+            p95 = float(np.percentile(seconds, 95)),
+            p99 = float(np.percentile(seconds, 99)),
+            mean = float(seconds.mean()),
+            n = len(seconds),
+            bytes = int(samples[-1][stage][1]),
+            peak_bytes = int(peaks[stage][2]),
+        )
+    return out
+
+
+def configs(args):
+    # The base case, then one dimension varied at a time
+    base = dict(bars=args.bars[0], trials=args.trials[0], tickers=args.tickers[0])
+    seen = [base]
+    for key, values in (("bars", args.bars), ("trials", args.trials), ("tickers", args.tickers)):
+        for value in values[1:]:
+            config = dict(base, **{key: value})
+            if config not in seen:
+                seen.append(config)
+    return seen
+
+
+def run(args):
+    os.environ.setdefault("OHLCV_DIR", tempfile.mkdtemp(prefix="bench-"))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import assignment3_zhuoran as m
+    m.SIM_WORKERS = args.workers
+    recorded = recorded_histories(args.fixtures) if args.fixtures else None
+
+    results = []
+    for config in configs(args):
+        frames = fixture_frames(recorded, config["bars"], config["tickers"])
+        use_fixtures(m, frames)
+        tickers = list(frames)
+        run_pipeline(m, tickers, args.days, config["trials"], args.model) # fixtures to disk, imports
+        samples = [run_pipeline(m, tickers, args.days, config["trials"], args.model)
+                   for _ in range(args.repeats)]
+        tracemalloc.start()
+        peaks = run_pipeline(m, tickers, args.days, config["trials"], args.model, trace=True)
+        tracemalloc.stop()
+        stages = summarize(samples, peaks)
+        results.append(dict(config = dict(config, days=args.days, model=args.model), stages = stages))
+        print(json.dumps(config), " ".join("{}={:.1f}ms".format(s, v["p50"] * 1e3) for s, v in stages.items()),
+              file=sys.stderr)
+
+    import plotly
+    return dict(
+        meta = dict(
+            created = time.strftime("%Y-%m-%dT%H:%M:%S"),
+            python = platform.python_version(),
+            numpy = np.__version__,
+            pandas = pd.__version__,
+            plotly = plotly.__version__,
+            fixtures = args.fixtures or "synthetic",
+            repeats = args.repeats,
+            workers = args.workers,
+        ),
+        results = results,
+    )
+
+
+#%% Figure serialization
+# The figures as they used to be built (plotly objects, Python lists, one trace
+# per path, stdlib JSON) against the dict figures with typed arrays, prebuilt
+# layouts and orjson that the dashboard now sends.
+
+def legacy_time_series(hist, title):
+    import plotly.express as px
+    from figures import RANGE_BUTTONS
+    fig = px.scatter(hist, y="Open", x='Date')
+    fig.update_layout(title_text = title, title_x = 0.5, yaxis = {'title': 'Price'})
+    fig.update_layout(xaxis = dict(rangeselector = dict(buttons = RANGE_BUTTONS),
+                                   rangeslider = dict(visible = False)))
+    return fig
+
+
+def legacy_paths(paths, title):
+    import plotly.graph_objects as go
+    x = list(range(paths.shape[1]))
+    fig = go.Figure(data = [go.Scatter(y = [i for i in path], x = x) for path in paths])
+    fig.update_layout(title_text = title, title_x = 0.5, yaxis = {'title': 'Price'})
+    return fig
+
+
+def serialization_cases(bars, trials, days=30):
+    from figures import plot_paths, time_series_figure
+    from models import GBM
+    from simulation import simulate_paths
+    hist = synthetic_history(bars)
+    paths = simulate_paths(100.0, GBM(0.0003, 0.02), days, trials, seed=SEED)
+    title = "Time Series Plot in a period of max of FIX0"
+    return {
+        "max_history": dict(
+            before = lambda: legacy_time_series(hist, title),
+            after = lambda: time_series_figure(hist["Date"], hist["Open"].to_numpy(), title)),
+        "{}_paths".format(trials): dict(
+            before = lambda: legacy_paths(paths, "GBM simulation of FIX0"),
+            after = lambda: plot_paths(paths, "GBM simulation of FIX0")),
+    }
+
+
+def run_serialization(bars=11000, trials=10000, repeats=3):
+    # {figure: {before|after: build/serialize p50 seconds and payload bytes}}
+    import plotly.io as pio
+    from figures import figure_json
+    encoders = dict(before = lambda fig: pio.to_json(fig, engine="json").encode(), after = figure_json)
+    out = {}
+    for name, builders in serialization_cases(bars, trials).items():
+        out[name] = {}
+        for variant, build in builders.items():
+            build_times, serialize_times = [], []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                fig = build()
+                build_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                payload = encoders[variant](fig)
+                serialize_times.append(time.perf_counter() - start)
+            out[name][variant] = dict(
+                build_p50 = float(np.median(build_times)),
+                serialize_p50 = float(np.median(serialize_times)),
+                bytes = len(payload),
+            )
+        print(name, " ".join("{}: build {:.1f}ms serialize {:.1f}ms {:.0f}kB".format(
+            variant, v["build_p50"] * 1e3, v["serialize_p50"] * 1e3, v["bytes"] / 1e3)
+            for variant, v in out[name].items()), file=sys.stderr)
+    return out
+
+
+#%% Comparison
+def compare(current, baseline, threshold=1.2, metric="p50"):
+    # Rows of (config, stage, before, after, ratio); ratio > threshold is a regression
+    def index(report):
+        return {(json.dumps(r["config"], sort_keys=True), stage): values[metric]
+                for r in report["results"] for stage, values in r["stages"].items()}
+    before, after = index(baseline), index(current)
+    rows = []
+    for key in after:
+        if key in before and before[key] > 0:
+            rows.append((*key, before[key], after[key], after[key] / before[key]))
+    regressions = [row for row in rows if row[-1] > threshold]
+    return rows, regressions
+
+
+def print_comparison(rows):
+    print("{:<60} {:<17} {:>10} {:>10} {:>7}".format("config", "stage", "before", "after", "ratio"))
+    for config, stage, before, after, ratio in rows:
+        print("{:<60} {:<17} {:>8.1f}ms {:>8.1f}ms {:>6.2f}x".format(
+            config, stage, before * 1e3, after * 1e3, ratio))
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bars", type=int_list, default=[2500, 500, 11000],
+                        help="history lengths; the first one is the base case")
+    parser.add_argument("--trials", type=int_list, default=[10000, 1000, 100000])
+    parser.add_argument("--tickers", type=int_list, default=[1, 8])
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--model", default="gbm")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--fixtures", help="directory of recorded TICKER.feather files")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", help="earlier --output file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="after/before ratio counted as a regression")
+    parser.add_argument("--serialization", action="store_true",
+                        help="only compare figure building/serialization before and after "
+                             "the typed-array fast path (max history and a 10k-path figure)")
+    args = parser.parse_args(argv)
+
+    if args.serialization:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        report = dict(serialization = run_serialization(args.bars[-1], args.trials[0], args.repeats))
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+        return 0
+
+    report = run(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(report, baseline, args.threshold)
+        print_comparison(rows)
+        if regressions:
+            print("{} stage(s) slower than {}x the baseline".format(len(regressions), args.threshold))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+log = logging.getLogger(__name__)
+
+# Every ttl_cache registers itself here so its counters can be inspected
+caches = {}
+
+# Optional cross-process backend (see shared_cache) consulted by shared caches
+shared_backend = None
+
+
+def configure_shared_cache(backend):
+    global shared_backend
+    shared_backend = backend
+
+
+def estimate_size(value):
+    # Rough in-memory size in bytes of a cached value
+    if hasattr(value, "memory_usage"):  # DataFrame / Series
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    if hasattr(value, "nbytes"):  # numpy array
+        return int(value.nbytes)
+    if hasattr(value, "to_plotly_json"):  # Figure / trace
+        return estimate_size(value.to_plotly_json())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _make_key(args, kwargs):
+    key = (args, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        # Lists of traces and other unhashable arguments are keyed by their repr
+        key = repr(key)
+    return key
+
+
+def ttl_cache(maxsize=128, ttl=None, max_bytes=None, shared=False, version=None):
+    """LRU memoization with a size bound, an expiry and hit/miss counters.
+
+    ttl is a number of seconds or a callable returning one (e.g. market_ttl);
+    None keeps entries until they are evicted. max_bytes bounds the estimated
+    memory held by the function's entries. With shared=True a local miss is
+    looked up in the configured shared backend before the function is called,
+    so several worker processes compute each value only once. version, a callable
+    taking the same arguments, is made part of every key (local and shared): when
+    it changes, e.g. the mtime of the file a result was computed from, the old
+    entries are simply never read again. A computed value is stored under the
+    version read after the call, so a call that rewrote that file is not missed
+    again next time.
+    """
+
+    def decorator(func):
+        entries = OrderedDict()  # key -> (value, expires_at, size)
+        lock = threading.Lock()
+        stats = dict(hits=0, misses=0, evictions=0, expirations=0, bytes=0, shared_hits=0, shared_errors=0)
+
+        def _after_fork():
+            # A forked child (e.g. a background callback job) may inherit the lock
+            # held by a parent thread that does not exist there
+            nonlocal lock
+            lock = threading.Lock()
+
+        os.register_at_fork(after_in_child=_after_fork)
+
+        def _evict(key):
+            value, expires, size = entries.pop(key)
+            stats["bytes"] -= size
+
+        def _key(args, kwargs):
+            key = _make_key(args, kwargs)
+            return key if version is None else (key, version(*args, **kwargs))
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = _key(args, kwargs)
+            now = time.monotonic()
+            with lock:
+                if key in entries:
+                    value, expires, size = entries[key]
+                    if expires is None or expires > now:
+                        entries.move_to_end(key)
+                        stats["hits"] += 1
+                        return value
+                    _evict(key)
+                    stats["expirations"] += 1
+                stats["misses"] += 1
+
+            seconds = ttl() if callable(ttl) else ttl
+            backend = shared_backend if shared else None
+            value = None
+            if backend is not None:
+                from shared_cache import deserialize, make_key
+                shared_key = make_key(func.__qualname__, key)
+                try:
+                    data = backend.get(shared_key)
+                    if data is not None:
+                        value = deserialize(data)
+                        with lock:
+                            stats["shared_hits"] += 1
+                except Exception:
+                    # An unreachable backend or a bad entry only costs a local compute
+                    log.warning("shared cache read failed for %s", func.__qualname__, exc_info=True)
+                    with lock:
+                        stats["shared_errors"] += 1
+            if value is None:
+                value = func(*args, **kwargs)
+                if version is not None:
+                    key = _key(args, kwargs)  # the call may have rewritten what version reads
+                if backend is not None:
+                    from shared_cache import make_key, serialize
+                    try:
+                        backend.set(make_key(func.__qualname__, key), serialize(value), seconds)
+                    except Exception:
+                        log.warning("shared cache write failed for %s", func.__qualname__, exc_info=True)
+                        with lock:
+                            stats["shared_errors"] += 1
+
+            expires = None if seconds is None else time.monotonic() + seconds
+            size = estimate_size(value)
+            with lock:
+                if key in entries:
+                    _evict(key)
+                entries[key] = (value, expires, size)
+                stats["bytes"] += size
+                while len(entries) > maxsize or (max_bytes is not None and stats["bytes"] > max_bytes and len(entries) > 1):
+                    _evict(next(iter(entries)))
+                    stats["evictions"] += 1
+            return value
+
+        def cache_get(*args, **kwargs):
+            # Cached value for these arguments, or None; never calls the function
+            key = _key(args, kwargs)
+            with lock:
+                if key in entries:
+                    value, expires, size = entries[key]
+                    if expires is None or expires > time.monotonic():
+                        return value
+            return None
+
+        def cache_info():
+            with lock:
+                return dict(stats, size=len(entries), maxsize=maxsize, max_bytes=max_bytes)
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+                stats["bytes"] = 0
+
+        wrapper.cache_get = cache_get
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
+        caches[func.__qualname__] = wrapper
+        return wrapper
+
+    return decorator
+
+
+def cache_stats():
+    return {name: wrapper.cache_info() for name, wrapper in caches.items()}
@@ -0,0 +1,346 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from market import NEW_YORK, next_close
+
+
+#%% Providers
+# A provider is anything with a history(ticker, period="max", start=None) method
+# returning a frame with a 'Date' column, the same shape download_data produces.
+
+class YahooProvider:
+    def history(self, ticker, period="max", start=None):
+        import yfinance as yf
+        myTicker = yf.Ticker(ticker)
+        if start is not None:
+            hist = myTicker.history(start=start)
+        else:
+            hist = myTicker.history(period=period)
+        hist = hist.reset_index()
+        hist['Date'] = pd.to_datetime(hist['Date'], errors = 'coerce')
+        return hist
+
+    def history_many(self, tickers, period="max"):
+        # One batched request for several symbols, split back into one frame each
+        import yfinance as yf
+        wide = yf.Tickers(" ".join(tickers)).history(period=period, group_by="ticker")
+        frames = {}
+        for ticker in tickers:
+            if ticker not in wide.columns.get_level_values(0):
+                continue
+            hist = wide[ticker].dropna(how="all").reset_index()
+            hist['Date'] = pd.to_datetime(hist['Date'], errors = 'coerce')
+            frames[ticker] = hist
+        return frames
+
+
+class FrameProvider:
+    # Serves histories from frames held in memory, so the store can run offline
+    def __init__(self, frames):
+        self.frames = frames
+        self.calls = []
+
+    def history(self, ticker, period="max", start=None):
+        self.calls.append((ticker, period, start))
+        hist = self.frames[ticker]
+        if start is not None:
+            hist = hist[hist['Date'] >= pd.Timestamp(start, tz=hist['Date'].dt.tz)]
+        return hist.reset_index(drop=True).copy()
+
+    def history_many(self, tickers, period="max"):
+        self.calls.append((tuple(tickers), period, None))
+        return {t: self.frames[t].reset_index(drop=True).copy() for t in tickers if t in self.frames}
+
+
+#%% On-disk store
+# Where every app keeps its histories (and the derived stats and job results)
+DATA_DIR = os.environ.get("OHLCV_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+
+class OHLCVStore:
+    """Feather file per ticker in front of a provider.
+
+    A refresh fetches again from the last stored bar, which replaces it if it was
+    a partial day, and appends what came after; reloads read the file instead of
+    going back to the provider.
+    """
+
+    def __init__(self, root, provider=None, max_age=3600):
+        self.root = root
+        self.provider = provider if provider is not None else YahooProvider()
+        self.max_age = max_age
+        self.locks = {}  # ticker -> lock held while it is read, fetched and written
+        self.locks_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A forked child (e.g. a background callback job) may inherit locks held by
+        # parent threads that do not exist there
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def lock(self, ticker):
+        with self.locks_lock:
+            return self.locks.setdefault(ticker.upper(), threading.Lock())
+
+    def path(self, ticker):
+        return os.path.join(self.root, "{}.feather".format(ticker.upper()))
+
+    def generation(self):
+        # Newest mtime of any ticker's file: changes whenever some history is
+        # rewritten, for keys that cannot name the ticker
+        with os.scandir(self.root) as entries:
+            return max((entry.stat().st_mtime_ns for entry in entries if entry.name.endswith(".feather")),
+                       default=0)
+
+    def version(self, ticker):
+        # Changes whenever the ticker's file is rewritten (or touched); None if absent
+        try:
+            return os.stat(self.path(ticker)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def read(self, ticker):
+        path = self.path(ticker)
+        if not os.path.exists(path):
+            return None
+        # A full read: to_pandas copies the columns anyway, so memory-mapping buys nothing
+        return pd.read_feather(path)
+
+    def write(self, ticker, hist):
+        # Through a temp file of its own, so concurrent writers never share one
+        path = self.path(ticker)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".{}.".format(ticker.upper()), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                hist.reset_index(drop=True).to_feather(f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def is_fresh(self, ticker):
+        # Younger than max_age and written after the most recent market close
+        path = self.path(ticker)
+        if not os.path.exists(path):
+            return False
+        mtime = os.path.getmtime(path)
+        written = datetime.fromtimestamp(mtime, NEW_YORK)
+        return time.time() - mtime < self.max_age and next_close(written).timestamp() > time.time()
+
+    def load(self, ticker, refresh=False):
+        # refresh=True skips the max_age check, e.g. to pick up the closing bar.
+        # One load per ticker at a time; a second caller then finds the file fresh.
+        with self.lock(ticker):
+            return self._load(ticker, refresh)
+
+    def _load(self, ticker, refresh):
+        stored = self.read(ticker)
+        if stored is not None and not refresh and self.is_fresh(ticker):
+            return stored
+        if stored is None or stored.empty:
+            hist = self.provider.history(ticker, period="max")
+        else:
+            last = stored['Date'].max()
+            try:
+                # The last stored bar is fetched again, it may have been a partial day
+                new = self.provider.history(ticker, start=last.date())
+            except Exception:
+                # Keep serving the stored bars if the provider is unavailable
+                return stored
+            if new.empty:
+                os.utime(self.path(ticker))
+                return stored
+            hist = pd.concat([stored, new], ignore_index=True)
+            hist = hist.drop_duplicates(subset='Date', keep='last').sort_values('Date')
+        if hist.empty:
+            return hist
+        self.write(ticker, hist)
+        return self.read(ticker)
+
+    def load_many(self, tickers):
+        # Stored tickers are refreshed one by one (incrementally); tickers never
+        # seen before are fetched together in a single batched provider call
+        result = {}
+        missing = []
+        for ticker in tickers:
+            if os.path.exists(self.path(ticker)):
+                result[ticker] = self.load(ticker)
+            else:
+                missing.append(ticker)
+        if missing:
+            if hasattr(self.provider, "history_many"):
+                fetched = self.provider.history_many(missing)
+            else:
+                fetched = {t: self.provider.history(t) for t in missing}
+            for ticker, hist in fetched.items():
+                if not hist.empty:
+                    with self.lock(ticker):
+                        self.write(ticker, hist)
+                        result[ticker] = self.read(ticker)
+        return result
+
+
+def default_store():
+    # The store the apps share: DATA_DIR in front of Yahoo Finance
+    return OHLCVStore(DATA_DIR, YahooProvider())
+
+
+#%% Multi-ticker loader
+class MultiTickerLoader:
+    """Keeps one price column per ticker and returns them as an aligned wide frame.
+
+    Only tickers it has not loaded yet, or whose series has expired, are fetched,
+    so adding a symbol to a comparison costs one download rather than
+    re-downloading all of them. Expired series go back through store.load, which
+    tops the file up with the latest bars.
+    """
+
+    def __init__(self, store, column="Close", ttl=None):
+        self.store = store
+        self.column = column
+        self.ttl = ttl  # seconds or a callable returning them (e.g. market_ttl); None never expires
+        self.series = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The series stay valid in the child; only the lock is replaced
+        self.lock = threading.Lock()
+
+    def load(self, tickers):
+        now = time.monotonic()
+        with self.lock:
+            missing = [t for t in tickers
+                       if t not in self.series or (self.expires.get(t) is not None and self.expires[t] <= now)]
+        if missing:
+            loaded = self.store.load_many(missing)
+            seconds = self.ttl() if callable(self.ttl) else self.ttl
+            with self.lock:
+                for ticker, hist in loaded.items():
+                    self.series[ticker] = hist.set_index('Date')[self.column].rename(ticker)
+                    self.expires[ticker] = None if seconds is None else now + seconds
+        with self.lock:
+            columns = [self.series[t] for t in tickers if t in self.series]
+        if not columns:
+            return pd.DataFrame()
+        return pd.concat(columns, axis=1).sort_index()
+
+
+#%% Compact in-memory histories
+PRICE_COLUMNS = ("Open", "High", "Low", "Close")
+# Corporate-action columns, dropped when zero throughout; Volume always stays,
+# even when it is zero throughout as for FX pairs and indices (EURUSD=X, ^VIX)
+ACTION_COLUMNS = ("Dividends", "Stock Splits", "Capital Gains")
+
+
+class CompactHistory:
+    """Shrinks histories held in memory and reports what they cost.
+
+    Prices are stored as float32, Volume as the smallest integer type that holds
+    it, Dividends, Stock Splits and Capital Gains are dropped when zero throughout,
+    and tickers trading on the same calendar share one Date array.
+    Row slices of the result (slice_period) stay views of it.
+    """
+
+    def __init__(self, price_dtype=np.float32, max_calendars=32):
+        self.price_dtype = price_dtype
+        self.max_calendars = max_calendars
+        self.calendars = []  # shared Date arrays, longest first
+        self.sizes = {}
+        self.lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # Shared calendars and sizes are kept, the lock is not
+        self.lock = threading.Lock()
+
+    def shared_dates(self, dates):
+        # A view of a known calendar that ends with the same dates, or a new one
+        values = dates.array
+        with self.lock:
+            for calendar in self.calendars:
+                tail = calendar[len(calendar) - len(values):]
+                if (len(calendar) >= len(values) and calendar.dtype == values.dtype
+                        and calendar[-1] == values[-1] and np.array_equal(tail.asi8, values.asi8)):
+                    return tail, True
+            self.calendars.append(values)
+            self.calendars.sort(key=len, reverse=True)
+            del self.calendars[self.max_calendars:]
+        return values, False
+
+    def compact(self, ticker, hist):
+        if hist.empty:
+            return hist
+        columns = {}
+        shared = False
+        for name in hist.columns:
+            column = hist[name]
+            if name == "Date":
+                column, shared = self.shared_dates(column)
+            elif name in PRICE_COLUMNS:
+                column = column.to_numpy(dtype=self.price_dtype)
+            elif name in ACTION_COLUMNS and not column.any():
+                continue
+            elif pd.api.types.is_integer_dtype(column):
+                column = pd.to_numeric(column, downcast="unsigned" if column.min() >= 0 else "integer").to_numpy()
+            columns[name] = column
+        compact = pd.DataFrame(columns, copy=False)
+        with self.lock:
+            self.sizes[ticker] = dict(
+                rows = len(compact),
+                bytes = int(compact.drop(columns="Date", errors="ignore").memory_usage(index=False).sum()),
+                date_bytes = 0 if shared or "Date" not in compact else int(compact["Date"].nbytes),
+                original_bytes = int(hist.memory_usage(index=False).sum()),
+            )
+        return compact
+
+    def report(self):
+        # Bytes per ticker; shared calendars are counted once, in calendar_bytes
+        with self.lock:
+            frame = pd.DataFrame.from_dict(self.sizes, orient="index")
+            calendar_bytes = sum(calendar.nbytes for calendar in self.calendars)
+        frame.index.name = "ticker"
+        frame.attrs["calendar_bytes"] = calendar_bytes
+        return frame
+
+    def info(self):
+        with self.lock:
+            return dict(tickers=len(self.sizes), calendars=len(self.calendars),
+                        bytes=sum(size["bytes"] for size in self.sizes.values()),
+                        original_bytes=sum(size["original_bytes"] for size in self.sizes.values()),
+                        calendar_bytes=sum(calendar.nbytes for calendar in self.calendars))
+
+
+#%% Period views
+# yfinance period strings answered from a full, date-sorted history: "Nd" is the
+# last N bars, "Nwk"/"Nmo"/"Ny" count back from the last bar, "ytd" starts on
+# January 1st of its year and "max" keeps everything.
+
+def period_start(period, end):
+    period = period.lower()
+    if period == "ytd":
+        return pd.Timestamp(year=end.year, month=1, day=1, tz=end.tz)
+    for suffix, unit in (("mo", "months"), ("wk", "weeks"), ("y", "years")):
+        if period.endswith(suffix):
+            return end - pd.DateOffset(**{unit: int(period[:-len(suffix)])})
+    raise ValueError("Unsupported period: {}".format(period))
+
+
+def slice_period(hist, period="max"):
+    # Row slice of hist (a view, no copy) covering the requested period
+    if period in (None, "max") or hist.empty:
+        return hist.iloc[0:]
+    if period.lower().endswith("d") and period.lower() != "ytd":
+        return hist.iloc[-int(period[:-1]):]
+    start = period_start(period, hist['Date'].iloc[-1])
+    return hist.iloc[hist['Date'].searchsorted(start, side="right"):]
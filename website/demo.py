@@ -1,101 +1,148 @@
+import time
+STARTED = time.perf_counter() # Reference point for time-to-first-byte
+
 import dash
 import pandas as pd
-import yfinance as yf
 import plotly.express as px
-from dash import Dash, html, dcc
+import plotly.graph_objects as go
+from dash import Dash, html, dcc, callback, Input, Output
+from dash.exceptions import PreventUpdate
 
-#%% Data Download Section
+from cache import ttl_cache
+from downsample import downsample, relayout_window, window
+from market import market_ttl
+from server_timing import install_timing
+
+MAX_POINTS = 2000
 ticker = 'AAPL'
-myTicker = yf.Ticker(ticker)
-hist = myTicker.history(period="max")
 
-hist = hist.reset_index()
-hist['Date'] = pd.to_datetime(hist['Date'], errors = 'coerce')
+#%% Data Download Section
+# Downloaded on first use, not at import, and again once the market data is due
+@ttl_cache(maxsize=1, ttl=market_ttl)
+def download_data(ticker):
+    import yfinance as yf
+    myTicker = yf.Ticker(ticker)
+    hist = myTicker.history(period="max")
+
+    hist = hist.reset_index()
+    hist['Date'] = pd.to_datetime(hist['Date'], errors = 'coerce')
+    return hist
 
-hist['Date'].max()
 #%% Graph generation
-fig = px.scatter(hist, y="Open", x='Date')
-
-# The update_layout method allows us to give some formatting to the graph
-fig.update_layout(
-    title_text = "Time Series Plot of {}".format(ticker),
-    title_x = 0.5,
-    yaxis = {
-        'title': 'Price'}
-)
+def make_figure(hist):
+    fig = px.scatter(downsample(hist, "Open", MAX_POINTS), y="Open", x='Date')
+    style_figure(fig)
+    fig.layout.uirevision = ticker
+    return fig
 
-# here blank
-
-# Add range slider
-fig.update_layout(
-    xaxis=dict(
-        rangeselector=dict(
-            buttons=list([
-                dict(count=1,
-                     label="1m",
-                     step="month",
-                     # stepmode="backward"
-                     ),
-                dict(count=6,
-                     label="6m",
-                     step="month",
-                     # stepmode="backward"
-                     ),
-                dict(count=1,
-                     label="YTD",
-                     step="year",
-                     # stepmode="todate"
-                     ),
-                dict(count=1,
-                     label="1y",
-                     step="year",
-                     # stepmode="backward"
-                     ),
-                dict(step="all")
-            ])
-        ),
-        rangeslider=dict(
-            visible=False
-        ),
-        # type="date",
-        # title='This is a date'
+
+def style_figure(fig):
+    # The update_layout method allows us to give some formatting to the graph
+    fig.update_layout(
+        title_text = "Time Series Plot of {}".format(ticker),
+        title_x = 0.5,
+        yaxis = {
+            'title': 'Price'}
     )
-)
+
+    # here blank
+
+    # Add range slider
+    fig.update_layout(
+        xaxis=dict(
+            rangeselector=dict(
+                buttons=list([
+                    dict(count=1,
+                         label="1m",
+                         step="month",
+                         # stepmode="backward"
+                         ),
+                    dict(count=6,
+                         label="6m",
+                         step="month",
+                         # stepmode="backward"
+                         ),
+                    dict(count=1,
+                         label="YTD",
+                         step="year",
+                         # stepmode="todate"
+                         ),
+                    dict(count=1,
+                         label="1y",
+                         step="year",
+                         # stepmode="backward"
+                         ),
+                    dict(step="all")
+                ])
+            ),
+            rangeslider=dict(
+                visible=False
+            ),
+            # type="date",
+            # title='This is a date'
+        )
+    )
+    return fig
+
 
 #%% Dash app
-app = Dash()
-
-app.layout = html.Div(
-    [
-        html.Center(html.H4('My Very First Dash App - Yey!!!')),
-        
-        html.Div('''
-             This app displays a graph of the entire price history of {}.'''.format(ticker),
-             style = {
-                 'width': '60%',
-                 'text-align': 'center',
-                 'margin-left': 'auto',
-                 'margin-right': 'auto',
-             }
-        ),
-        
-        dcc.Graph(figure = fig)
-        
-        
-    ],  #I could also put the list comprehension here
-    style ={
-        'margin': '2em',
-        'border-radius': '1em',
-        'border-style': 'solid', 
-        'padding': '2em',
-        'background': '#ededed'
-    }
-)
-       
-print('About to start...')
-                 
-app.run_server(
-    debug = True,
-    port = 8060
+def create_app():
+    # The page is served straight away with an empty, styled graph; the initial
+    # callback downloads the data and fills it in
+    app = Dash(__name__)
+    app.startup_timing = install_timing(app.server, STARTED)
+
+    app.layout = html.Div(
+        [
+            html.Center(html.H4('My Very First Dash App - Yey!!!')),
+
+            html.Div('''
+                 This app displays a graph of the entire price history of {}.'''.format(ticker),
+                 style = {
+                     'width': '60%',
+                     'text-align': 'center',
+                     'margin-left': 'auto',
+                     'margin-right': 'auto',
+                 }
+            ),
+
+            dcc.Graph(figure = style_figure(go.Figure()), id="graphic")
+
+
+        ],  #I could also put the list comprehension here
+        style ={
+            'margin': '2em',
+            'border-radius': '1em',
+            'border-style': 'solid', 
+            'padding': '2em',
+            'background': '#ededed'
+        }
+    )
+    return app
+
+# Runs once on page load, then again whenever zooming needs the full-resolution
+# bars of the visible window
+@callback(
+    Output(component_id="graphic", component_property="figure"),
+    Input(component_id="graphic", component_property="relayoutData")
 )
+def update_graph(relayout_data):
+    x_range = relayout_window(relayout_data)
+    if x_range is False and dash.ctx.triggered_id == "graphic":
+        raise PreventUpdate
+    hist = download_data(ticker)
+    visible = window(hist, *x_range) if x_range else hist
+    fig = make_figure(visible)
+    if x_range:
+        fig.update_layout(xaxis_range = list(x_range))
+    return fig
+
 
+if __name__ == "__main__":
+    print('About to start...')
+    app = create_app()
+
+    app.run_server(
+        debug = True,
+        port = 8060
+    )
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+
+#%% Downsampling
+# Both functions return the sorted row positions to keep, so the caller can take
+# hist.iloc[idx] and keep every column of the selected bars.
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: keeps the point of each bucket that forms
+    # the largest triangle with the previous pick and the next bucket's average
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _as_float(x)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Averages of every bucket, used as the third vertex of the triangle
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    avg_x = np.append(sums_x / sizes, x[-1])
+    avg_y = np.append(sums_y / sizes, y[-1])
+
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a])
+                      - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def minmax(x, y, n_out):
+    # Keeps the lowest and highest point of each bucket, roughly one bucket per pixel
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    size = int(np.ceil(n / (n_out // 2)))
+    padded = np.full(size * int(np.ceil(n / size)), np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(-1, size)
+    starts = np.arange(len(buckets)) * size
+    keep = np.concatenate([[0, n - 1], starts + np.nanargmin(buckets, axis=1),
+                           starts + np.nanargmax(buckets, axis=1)])
+    return np.unique(keep)
+
+
+METHODS = dict(lttb=lttb, minmax=minmax)
+
+
+def downsample(hist, y, n_out, x="Date", method="lttb"):
+    if n_out is None or len(hist) <= n_out:
+        return hist
+    idx = METHODS[method](hist[x].values, hist[y].values, n_out)
+    return hist.iloc[idx]
+
+
+def window(hist, start=None, end=None, x="Date"):
+    # Rows of a date-sorted frame between start and end, found by binary search
+    dates = hist[x]
+    tz = dates.dt.tz
+
+    def _stamp(value):
+        value = pd.Timestamp(value)
+        if tz is not None and value.tzinfo is None:
+            return value.tz_localize(tz)
+        return value
+
+    lo = 0 if start is None else dates.searchsorted(_stamp(start), side="left")
+    hi = len(hist) if end is None else dates.searchsorted(_stamp(end), side="right")
+    return hist.iloc[lo:hi]
+
+
+def relayout_window(relayout_data):
+    # Visible x range from a graph's relayoutData: (start, end), None when the user
+    # reset the axis, or False when the event is not an x-axis change
+    if not relayout_data:
+        return False
+    if "xaxis.range[0]" in relayout_data and "xaxis.range[1]" in relayout_data:
+        return relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]
+    if "xaxis.range" in relayout_data:
+        return tuple(relayout_data["xaxis.range"])
+    if relayout_data.get("xaxis.autorange"):
+        return None
+    return False
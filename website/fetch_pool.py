@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+
+class FetchPool:
+    """Bounded thread pool for provider calls, with timeouts and retries.
+
+    call() retries a failing fetch with exponential backoff within one overall
+    deadline and, when every attempt fails, returns the last good result for the
+    same arguments. An attempt that is still running when the deadline passes is
+    not retried, so two fetches of the same thing never run side by side.
+    """
+
+    def __init__(self, max_workers=8, timeout=20, retries=2, backoff=0.5, snapshots=64):
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="fetch")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_snapshots = snapshots
+        self.snapshots = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = dict(submitted=0, completed=0, active=0, queued=0, peak_active=0,
+                          saturated=0, timeouts=0, failures=0, retries=0, fallbacks=0)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The worker threads do not survive a fork; a forked child (e.g. a background
+        # callback job) gets a fresh executor
+        self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="fetch")
+        self.lock = threading.Lock()
+        self.stats.update(active=0, queued=0)
+
+    def _run(self, fn, args, kwargs):
+        with self.lock:
+            self.stats["queued"] -= 1
+            self.stats["active"] += 1
+            self.stats["peak_active"] = max(self.stats["peak_active"], self.stats["active"])
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.stats["active"] -= 1
+                self.stats["completed"] += 1
+
+    def submit(self, fn, *args, **kwargs):
+        with self.lock:
+            self.stats["submitted"] += 1
+            self.stats["queued"] += 1
+            if self.stats["active"] + self.stats["queued"] > self.max_workers:
+                self.stats["saturated"] += 1
+        return self.executor.submit(self._run, fn, args, kwargs)
+
+    def _result(self, future, timeout):
+        try:
+            return future.result(timeout if timeout is not None else self.timeout)
+        except FutureTimeout:
+            with self.lock:
+                self.stats["timeouts"] += 1
+                if future.cancel():
+                    self.stats["queued"] -= 1
+            raise
+        except Exception:
+            with self.lock:
+                self.stats["failures"] += 1
+            raise
+
+    def _remember(self, key, result):
+        with self.lock:
+            self.snapshots[key] = result
+            self.snapshots.move_to_end(key)
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+
+    def _fallback(self, key, error):
+        with self.lock:
+            if key not in self.snapshots:
+                raise error if error is not None else FutureTimeout()
+            self.stats["fallbacks"] += 1
+            return self.snapshots[key]
+
+    def call(self, fn, *args, timeout=None, **kwargs):
+        # timeout bounds the whole call: every attempt and the backoff in between
+        key = (getattr(fn, "__qualname__", repr(fn)), args, tuple(sorted(kwargs.items())))
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                pause = self.backoff * 2 ** (attempt - 1)
+                if time.monotonic() + pause >= deadline:
+                    break
+                with self.lock:
+                    self.stats["retries"] += 1
+                time.sleep(pause)
+            try:
+                result = self._result(self.submit(fn, *args, **kwargs), deadline - time.monotonic())
+            except FutureTimeout as e:
+                # The attempt may still be running; a retry would race it
+                error = e
+                break
+            except Exception as e:
+                error = e
+                continue
+            self._remember(key, result)
+            return result
+        return self._fallback(key, error)
+
+    def gather(self, fn, arg_list, timeout=None):
+        # fn(*args) for every args tuple at once, within one deadline; failed
+        # calls go through call()'s retry, timed-out ones straight to the snapshot
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        name = getattr(fn, "__qualname__", repr(fn))
+        futures = [self.submit(fn, *args) for args in arg_list]
+        results = []
+        for args, future in zip(arg_list, futures):
+            key = (name, tuple(args), ())
+            try:
+                result = self._result(future, max(deadline - time.monotonic(), 0))
+                self._remember(key, result)
+            except FutureTimeout as e:
+                result = self._fallback(key, e)
+            except Exception:
+                result = self.call(fn, *args, timeout=max(deadline - time.monotonic(), 0))
+            results.append(result)
+        return results
+
+    def info(self):
+        with self.lock:
+            return dict(self.stats, max_workers=self.max_workers, snapshots=len(self.snapshots))
+
+
+def pool_from_env():
+    # The pool every app uses: FETCH_WORKERS threads, FETCH_TIMEOUT seconds per call
+    return FetchPool(max_workers = int(os.environ.get("FETCH_WORKERS", 8)),
+                     timeout = float(os.environ.get("FETCH_TIMEOUT", 20)))
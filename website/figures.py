@@ -0,0 +1,214 @@
+from functools import lru_cache
+
+import numpy as np
+import plotly.graph_objects as go
+
+
+#%% Typed arrays
+# Trace data goes out in plotly's {"dtype", "bdata"} encoding (plotly.js >= 2.28):
+# the raw little-endian buffer in base64, which the browser reads straight into a
+# Float64Array / Float32Array / Int32Array instead of parsing one number at a time.
+
+def typed_array(values, dtype="f8"):
+    import base64
+    array = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+    return {"dtype": dtype, "bdata": base64.b64encode(array.tobytes()).decode("ascii")}
+
+
+def date_array(dates):
+    # Dates as wall-clock milliseconds (plotly shows dates without their offset);
+    # needs xaxis type "date", which the time series layout sets
+    dates = dates.dt.tz_localize(None) if getattr(dates.dt, "tz", None) is not None else dates
+    return typed_array(dates.to_numpy("datetime64[ms]").astype(np.int64), "f8")
+
+
+def figure_json(fig):
+    # JSON bytes of a figure or dict figure; orjson when it is installed
+    if hasattr(fig, "to_plotly_json"):
+        fig = fig.to_plotly_json()
+    try:
+        import orjson
+    except ImportError:
+        import plotly.io as pio
+        return pio.to_json(fig, validate=False).encode()
+    return orjson.dumps(fig, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+#%% Prebuilt layouts
+# Layouts shared by every figure of a kind are built and validated through plotly
+# once, then kept as plain dicts. A figure copies the top level and only sets its
+# title and per-figure keys, so nothing is rebuilt or re-validated per call.
+
+RANGE_BUTTONS = [
+    dict(count=1, label="1m", step="month"),
+    dict(count=6, label="6m", step="month"),
+    dict(count=1, label="YTD", step="year"),
+    dict(count=1, label="1y", step="year"),
+    dict(step="all"),
+]
+
+LAYOUTS = dict(
+    time_series = dict(
+        title_x = 0.5,
+        yaxis = {'title': 'Price'},
+        xaxis = dict(
+            title = 'Date',
+            type = 'date',
+            rangeselector = dict(buttons = RANGE_BUTTONS),
+            rangeslider = dict(visible = False),
+        ),
+        legend_tracegroupgap = 0,
+        margin = dict(t = 60),
+    ),
+    barchart = dict(
+        barmode = 'group',
+        title = 'Bar Chart of Equity Returns grouped by Volume',
+        paper_bgcolor = 'white',
+        plot_bgcolor = 'white',
+        xaxis = dict(
+            showline = True,
+            linewidth = 2,
+            linecolor = 'black'
+        ),
+        yaxis = dict(
+            title = 'Stock Returns',
+            titlefont_size = 16,
+            tickfont_size = 14,
+            gridcolor = '#dfe5ed'
+        ),
+        hovermode = 'x',
+    ),
+    fan = dict(
+        title_x = 0.5,
+        xaxis = {'title': 'Days'},
+        yaxis = {'title': 'Price'}
+    ),
+    histogram = dict(
+        title_x = 0.5,
+        bargap = 0,
+        xaxis = {'title': 'Price'},
+        yaxis = {'title': 'Count'}
+    ),
+)
+
+
+@lru_cache(maxsize=None)
+def layout_template(name):
+    fig = go.Figure()
+    fig.update_layout(**LAYOUTS[name])
+    return fig.to_plotly_json()["layout"]
+
+
+def figure_layout(name, title=None, **updates):
+    # Copy of a prebuilt layout; dict values are merged one level deep, e.g.
+    # xaxis = dict(range = [...]) keeps the rangeselector
+    layout = dict(layout_template(name))
+    if title is not None:
+        layout["title"] = dict(layout.get("title", {}), text = title)
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(layout.get(key), dict):
+            value = dict(layout[key], **value)
+        layout[key] = value
+    return layout
+
+
+def time_series_figure(dates, values, title, name="Open", **layout):
+    # px.scatter's look: markers, WebGL above 1000 points, no legend
+    trace = dict(
+        type = "scattergl" if len(values) > 1000 else "scatter",
+        mode = "markers",
+        x = date_array(dates),
+        y = typed_array(values, "f4" if values.dtype == np.float32 else "f8"),
+        marker = dict(color = "#636efa"),
+        hovertemplate = "Date=%{{x}}<br>{}=%{{y}}<extra></extra>".format(name),
+        showlegend = False,
+    )
+    return dict(data = [trace], layout = figure_layout("time_series", title, **layout))
+
+
+#%% Monte Carlo fan chart
+# A constant number of traces whatever the trial count: filled percentile bands,
+# the median and a small fixed sample of paths.
+
+def plot_fan_chart(summary, title, colour="31, 119, 180"):
+    x = typed_array(np.arange(summary["days"]), "i4")
+    bands = dict(zip(summary["percentiles"], summary["bands"]))
+    qs = sorted(bands)
+
+    data = []
+    # Outer bands first so the inner ones are drawn on top of them
+    for i in range(len(qs) // 2):
+        lower, upper = qs[i], qs[-1 - i]
+        data.append(dict(type = "scatter", x = x, y = typed_array(bands[lower]), mode = "lines",
+                         line = dict(width = 0), showlegend = False, hoverinfo = "skip",
+                         name = "p{}".format(lower)))
+        data.append(dict(type = "scatter", x = x, y = typed_array(bands[upper]), mode = "lines",
+                         line = dict(width = 0), fill = "tonexty",
+                         fillcolor = "rgba({}, {})".format(colour, 0.15 * (i + 1)),
+                         name = "{}-{}%".format(lower, upper)))
+    if len(qs) % 2:
+        median = qs[len(qs) // 2]
+        data.append(dict(type = "scatter", x = x, y = typed_array(bands[median]), mode = "lines",
+                         line = dict(color = "rgb({})".format(colour), width = 2),
+                         name = "median" if median == 50 else "p{}".format(median)))
+
+    paths = summary.get("paths")
+    if paths is not None and len(paths):
+        data.append(path_trace(paths, line = dict(color = "rgba(80, 80, 80, 0.35)", width = 1)))
+
+    return dict(data = data, layout = figure_layout("fan", title))
+
+
+def path_trace(paths, **props):
+    # Every path in one line trace, separated by NaN gaps, instead of a trace per path
+    trials, days = paths.shape
+    x = np.tile(np.append(np.arange(days, dtype=np.float64), np.nan), trials)
+    y = np.column_stack([paths, np.full(trials, np.nan)]).ravel()
+    # float32 is exact for day numbers and plenty for drawing prices
+    trace = dict(type = "scatter", x = typed_array(x, "f4"), y = typed_array(y, "f4"), mode = "lines",
+                 connectgaps = False, showlegend = False, hoverinfo = "skip")
+    trace.update(props)
+    return trace
+
+
+def plot_paths(paths, title, **props):
+    return dict(data = [path_trace(paths, **props)], layout = figure_layout("fan", title))
+
+
+def plot_terminal_histogram(terminal, title, bins=50):
+    # Histogram from pre-binned counts rather than every raw terminal price
+    counts, edges = np.histogram(terminal, bins = bins)
+    trace = dict(type = "bar", x = typed_array((edges[:-1] + edges[1:]) / 2), y = typed_array(counts, "i4"),
+                 width = typed_array(np.diff(edges)), name = "count")
+    return dict(data = [trace], layout = figure_layout("histogram", title))
+
+
+#%% Partial updates
+def patch_figure(fig, layout_keys=("title",)):
+    # Dash Patch carrying the traces and the listed layout entries only, so the
+    # static parts of the layout (rangeselector, axes styling) are not re-sent.
+    # Keys may be dotted paths such as "xaxis.range".
+    from dash import Patch
+    fig_json = fig.to_plotly_json() if hasattr(fig, "to_plotly_json") else fig
+    patched = Patch()
+    patched["data"] = fig_json["data"]
+    for key in layout_keys:
+        source, target = fig_json["layout"], patched["layout"]
+        *parents, leaf = key.split(".")
+        for part in parents:
+            source, target = source.get(part, {}), target[part]
+        if leaf in source:
+            target[leaf] = source[leaf]
+    return patched
+
+
+def empty_figure(title, xaxis_title=None, yaxis_title=None):
+    # Placeholder shown until a callback patches the real traces in
+    fig = go.Figure()
+    fig.update_layout(
+        title_text = title,
+        title_x = 0.5,
+        xaxis = {'title': xaxis_title},
+        yaxis = {'title': yaxis_title}
+    )
+    return fig
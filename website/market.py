@@ -0,0 +1,61 @@
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+
+# Regular NYSE session. Exchange holidays are not modelled, on those days the
+# cache simply refreshes a little more often than it needs to.
+NEW_YORK = ZoneInfo("America/New_York")
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+
+
+def _now(now=None):
+    if now is None:
+        return datetime.now(NEW_YORK)
+    if now.tzinfo is None:
+        return now.replace(tzinfo=NEW_YORK)
+    return now.astimezone(NEW_YORK)
+
+
+def is_market_open(now=None):
+    now = _now(now)
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+
+def next_open(now=None):
+    now = _now(now)
+    day = now.date()
+    if now.time() >= MARKET_OPEN:
+        day += timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return datetime.combine(day, MARKET_OPEN, tzinfo=NEW_YORK)
+
+
+def next_close(now=None):
+    now = _now(now)
+    day = now.date()
+    if now.time() >= MARKET_CLOSE:
+        day += timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return datetime.combine(day, MARKET_CLOSE, tzinfo=NEW_YORK)
+
+
+def market_ttl(now=None, open_ttl=300):
+    # Seconds a price-derived result stays valid: a few minutes while the market
+    # trades, and until the next open once it has closed.
+    now = _now(now)
+    if is_market_open(now):
+        return min(open_ttl, (next_close(now) - now).total_seconds())
+    return (next_open(now) - now).total_seconds()
+
+
+def market_window(now=None, open_ttl=300):
+    # Label of the market_ttl window `now` falls in: a new one every open_ttl
+    # seconds while the market trades, one per closed period otherwise. Used where
+    # results are keyed rather than expired (background callback cache_by).
+    now = _now(now)
+    if is_market_open(now):
+        return "open:{}".format(int(now.timestamp() // open_ttl))
+    return "closed:{}".format(next_open(now).date().isoformat())
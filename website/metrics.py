@@ -0,0 +1,378 @@
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = ('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+               for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metrics:
+    """Counters and latency histograms, rendered in the Prometheus text format.
+
+    Series are keyed by metric name and a tuple of (label, value) pairs. Gauge
+    sources registered with add_gauges are read at scrape time, so the cache,
+    single-flight and fetch pool counters are exported without copying them.
+    A forked child starts with no series of its own; its export() can be handed
+    back to the server and merge()d there, e.g. by a collector that add_collector
+    registers to run before every render.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters = {}    # name -> {labels: value}
+        self.histograms = {}  # name -> {labels: [bucket counts..., sum, count]}
+        self.help = {}
+        self.gauges = []      # (prefix, fn, label)
+        self.collectors = []
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The parent's series stay with the parent, and so may its lock
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels=(), value=1, help=None):
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+            if help:
+                self.help.setdefault(name, help)
+
+    def observe(self, name, labels, seconds, help=None):
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            row = series.get(labels)
+            if row is None:
+                row = series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    row[i] += 1
+            row[-2] += seconds
+            row[-1] += 1
+            if help:
+                self.help.setdefault(name, help)
+
+    def add_gauges(self, prefix, fn, label=None):
+        # fn returns {key: number}, or {name: {key: number}} with the name put in `label`
+        self.gauges.append((prefix, fn, label))
+
+    def add_collector(self, fn):
+        # fn() is called before every render, e.g. to merge series from job processes
+        self.collectors.append(fn)
+
+    def export(self):
+        with self.lock:
+            return dict(counters = {name: dict(series) for name, series in self.counters.items()},
+                        histograms = {name: {k: list(v) for k, v in series.items()}
+                                      for name, series in self.histograms.items()},
+                        help = dict(self.help))
+
+    def merge(self, snapshot):
+        # Adds the series of another process's export()
+        with self.lock:
+            for name, series in snapshot["counters"].items():
+                mine = self.counters.setdefault(name, {})
+                for labels, value in series.items():
+                    mine[labels] = mine.get(labels, 0) + value
+            for name, series in snapshot["histograms"].items():
+                mine = self.histograms.setdefault(name, {})
+                for labels, row in series.items():
+                    total = mine.setdefault(labels, [0] * len(row))
+                    for i, value in enumerate(row):
+                        total[i] += value
+            for name, text in snapshot.get("help", {}).items():
+                self.help.setdefault(name, text)
+
+    def render(self):
+        for fn in self.collectors:
+            try:
+                fn()
+            except Exception:
+                continue
+        lines = []
+
+        def header(name, kind):
+            if name in self.help:
+                lines.append("# HELP {} {}".format(name, self.help[name]))
+            lines.append("# TYPE {} {}".format(name, kind))
+
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: {k: list(v) for k, v in series.items()} for name, series in self.histograms.items()}
+
+        for name in sorted(counters):
+            header(name, "counter")
+            for labels, value in sorted(counters[name].items()):
+                lines.append("{}{} {}".format(name, _labels(labels), value))
+
+        for name in sorted(histograms):
+            header(name, "histogram")
+            for labels, row in sorted(histograms[name].items()):
+                for bound, count in zip(self.buckets, row):
+                    lines.append("{}_bucket{} {}".format(name, _labels(labels + (("le", bound),)), count))
+                lines.append("{}_bucket{} {}".format(name, _labels(labels + (("le", "+Inf"),)), row[-1]))
+                lines.append("{}_sum{} {:.6f}".format(name, _labels(labels), row[-2]))
+                lines.append("{}_count{} {}".format(name, _labels(labels), row[-1]))
+
+        for prefix, fn, label in self.gauges:
+            try:
+                values = fn()
+            except Exception:
+                continue
+            rows = values.items() if label else [(None, values)]
+            series = {}
+            for owner, stats in rows:
+                for key, value in stats.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        labels = ((label, owner),) if label else ()
+                        series.setdefault("{}_{}".format(prefix, key), []).append((labels, value))
+            for name in sorted(series):
+                lines.append("# TYPE {} untyped".format(name))
+                for labels, value in series[name]:
+                    lines.append("{}{} {}".format(name, _labels(labels), value))
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+#%% Stage timing
+# @timed("download") / @timed("compute") / @timed("figure") on the data and compute
+# functions, or `with stage(...)` around inline code. Time is recorded exclusive of
+# nested stages, so a figure built on top of a simulation shows the two separately;
+# placed under @ttl_cache it only sees real work, the cache counters say how often
+# that was skipped.
+_local = threading.local()
+
+
+def _frames():
+    if not hasattr(_local, "frames"):
+        _local.frames = []
+        _local.accounted = 0.0
+    return _local.frames
+
+
+@contextmanager
+def stage(name, function):
+    # Times a block as one stage, e.g. figure code written inline in a callback
+    frames = _frames()
+    frames.append(0.0)  # time spent in nested stages
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.inc("dash_stage_errors_total", (("stage", name), ("function", function)),
+                    help="Exceptions raised inside timed stages")
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        nested = frames.pop()
+        if frames:
+            frames[-1] += elapsed
+        else:
+            _local.accounted += elapsed
+        metrics.observe("dash_stage_seconds", (("stage", name), ("function", function)), elapsed - nested,
+                        help="Wall time per stage, excluding nested stages")
+
+
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, func.__qualname__):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+#%% Sampling profiler
+class SamplingProfiler:
+    """Samples every thread's stack from a background thread.
+
+    Stacks are counted in the folded "outer;inner count" format that flamegraph
+    tools read. Off until start() is called; stop() keeps the samples.
+    """
+
+    def __init__(self, interval=0.01, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.control = threading.Lock()  # serializes start()
+        self.thread = None
+        self.running = threading.Event()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while self.running.is_set():
+            folded = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                folded.append(";".join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(folded)
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def start(self, interval=None):
+        with self.control:
+            if interval:
+                self.interval = interval
+            if self.running.is_set():
+                return
+            if self.thread is not None:
+                self.thread.join()  # a sampler stopped moments ago finishes its last sleep
+            self.running.set()
+            self.thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+
+    def reset(self):
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+
+    def folded(self, limit=None):
+        with self.lock:
+            rows = self.stacks.most_common(limit)
+        return "".join("{} {}\n".format(stack, count) for stack, count in rows)
+
+    def info(self):
+        with self.lock:
+            return dict(running=int(self.running.is_set()), samples=self.samples,
+                        stacks=len(self.stacks), interval=self.interval)
+
+
+profiler = SamplingProfiler(interval=float(os.environ.get("PROFILE_INTERVAL", 0.01)))
+metrics.add_gauges("dash_profiler", profiler.info)
+
+
+#%% Flask endpoints
+def callback_name():
+    # The callback's output id, e.g. "sim_plot.figure" or "..graphic.figure...bar.figure.."
+    from flask import request
+    body = request.get_json(silent=True) or {}
+    return body.get("output", "unknown")
+
+
+def install_metrics(server, token=None, public=None):
+    """Per-callback timing, payload bytes and errors, plus /metrics and /profile.
+
+    Each Dash callback request is timed as a whole; the part not spent in timed
+    stages (argument handling, untimed callback code, JSON encoding) is recorded
+    as stage "encode".
+    The endpoints are closed unless METRICS_TOKEN is set, in which case requests
+    must send it as a bearer token (or ?token=), or METRICS_PUBLIC=1 opens them
+    to everyone. The client address is not used: behind a proxy every request
+    comes from loopback.
+
+        curl -H "Authorization: Bearer $METRICS_TOKEN" localhost:8062/metrics
+        curl -X POST -H "Authorization: Bearer $METRICS_TOKEN" localhost:8062/profile/start
+        curl -H "Authorization: Bearer $METRICS_TOKEN" localhost:8062/profile > app.folded
+    """
+    from flask import Response, abort, g, request
+
+    if token is None:
+        token = os.environ.get("METRICS_TOKEN") or None
+    if public is None:
+        public = os.environ.get("METRICS_PUBLIC", "0") != "0"
+
+    def is_callback():
+        return request.path.endswith("/_dash-update-component")
+
+    @server.before_request
+    def _start_callback():
+        if is_callback():
+            _frames()
+            _local.accounted = 0.0
+            g.callback_started = time.perf_counter()
+
+    @server.after_request
+    def _record_callback(response):
+        started = g.pop("callback_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        labels = (("callback", callback_name()),)
+        metrics.inc("dash_callback_requests_total", labels + (("status", response.status_code),),
+                    help="Callback requests by response status")
+        metrics.observe("dash_callback_seconds", labels, elapsed, help="Wall time per callback request")
+        metrics.observe("dash_stage_seconds", (("stage", "encode"), ("function", labels[0][1])),
+                        max(elapsed - _local.accounted, 0.0))
+        if response.status_code >= 500:
+            metrics.inc("dash_callback_errors_total", labels, help="Callback requests that failed")
+        if not response.direct_passthrough:
+            metrics.inc("dash_callback_payload_bytes_total", labels, len(response.get_data()),
+                        help="Response bytes sent by callbacks")
+        return response
+
+    @server.teardown_request
+    def _record_exception(exc):
+        # Exceptions that skipped after_request (debug mode re-raises them)
+        if exc is not None and g.pop("callback_started", None) is not None:
+            metrics.inc("dash_callback_errors_total", (("callback", callback_name()),))
+
+    def check_client():
+        if token is not None:
+            header = request.headers.get("Authorization", "")
+            sent = header[len("Bearer "):] if header.startswith("Bearer ") else request.args.get("token", "")
+            if not hmac.compare_digest(sent.encode(), token.encode()):
+                abort(403)
+        elif not public:
+            abort(403)
+
+    @server.route("/metrics")
+    def _metrics():
+        check_client()
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    @server.route("/profile")
+    def _profile():
+        check_client()
+        limit = request.args.get("limit", type=int)
+        return Response(profiler.folded(limit), mimetype="text/plain")
+
+    @server.route("/profile/<action>", methods=["POST"])
+    def _profile_action(action):
+        check_client()
+        if action == "start":
+            profiler.start(request.args.get("interval", type=float))
+        elif action == "stop":
+            profiler.stop()
+        elif action == "reset":
+            profiler.reset()
+        else:
+            abort(404)
+        return profiler.info()
+
+    if os.environ.get("PROFILE", "0") != "0":
+        profiler.start()
+    return metrics
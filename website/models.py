@@ -0,0 +1,125 @@
+import numpy as np
+
+
+#%% Simulation models
+# Every model turns a Generator into a (trials, steps) block of daily log-returns
+# in one vectorized call, which is all simulation.py needs. scale() gives the
+# daily drift and volatility used to size the engine's percentile histograms.
+# Models are plain picklable objects so chunks can run in worker processes.
+
+
+def _finite_returns(stats, lookback=None):
+    r = stats["log_return"].to_numpy(dtype=np.float64)
+    r = r[np.isfinite(r)]
+    return r[-lookback:] if lookback else r
+
+
+class GBM:
+    """Constant drift and volatility, normally distributed log-returns."""
+
+    label = "GBM"
+
+    def __init__(self, drift, stdev):
+        self.drift = float(drift)
+        self.stdev = float(stdev)
+
+    @classmethod
+    def fit(cls, stats, estimator="expanding"):
+        from return_stats import gbm_parameters
+        _, drift, stdev = gbm_parameters(stats, estimator)
+        return cls(drift, stdev)
+
+    def scale(self):
+        return self.drift, self.stdev
+
+    def log_returns(self, rng, trials, steps, dtype=np.float64):
+        Z = rng.standard_normal((trials, steps), dtype=dtype)
+        return self.drift + self.stdev * Z
+
+
+class BlockBootstrap:
+    """Historical log-returns resampled in blocks of consecutive days.
+
+    Keeping blocks intact preserves short-range autocorrelation and volatility
+    clustering that an i.i.d. resample would lose.
+    """
+
+    label = "Block bootstrap"
+
+    def __init__(self, returns, block=5):
+        self.returns = np.asarray(returns, dtype=np.float64)
+        self.block = max(1, min(int(block), len(self.returns)))
+
+    @classmethod
+    def fit(cls, stats, block=5, lookback=None):
+        return cls(_finite_returns(stats, lookback), block)
+
+    def scale(self):
+        return self.returns.mean(), self.returns.std()
+
+    def log_returns(self, rng, trials, steps, dtype=np.float64):
+        blocks = -(-steps // self.block)
+        starts = rng.integers(0, len(self.returns) - self.block + 1, (trials, blocks))
+        idx = (starts[:, :, None] + np.arange(self.block)).reshape(trials, -1)[:, :steps]
+        return self.returns.astype(dtype, copy=False)[idx]
+
+
+class GARCH:
+    """GARCH(1,1) volatility around a constant mean log-return.
+
+    sigma2[t+1] = omega + alpha * eps[t]**2 + beta * sigma2[t], started from the
+    conditional variance after the last observed return.
+    """
+
+    label = "GARCH(1,1)"
+
+    def __init__(self, mu, omega, alpha, beta, sigma2):
+        self.mu = float(mu)
+        self.omega = float(omega)
+        self.alpha = float(alpha)
+        self.beta = float(beta)
+        self.sigma2 = float(sigma2)
+
+    @classmethod
+    def fit(cls, stats, lookback=2520, grid=20):
+        # Gaussian likelihood on a grid of (alpha, beta) with variance targeting;
+        # the recursion runs over the returns once for every grid point together
+        r = _finite_returns(stats, lookback)
+        mu = r.mean()
+        eps = r - mu
+        var = eps.var()
+        a, b = np.meshgrid(np.linspace(0.01, 0.3, grid), np.linspace(0.6, 0.99, grid))
+        keep = a + b < 0.999
+        a, b = a[keep], b[keep]
+        omega = var * (1 - a - b)
+        sigma2 = np.full(len(a), var)
+        loglik = np.zeros(len(a))
+        for e in eps:
+            loglik -= np.log(sigma2) + e * e / sigma2
+            sigma2 = omega + a * e * e + b * sigma2
+        best = np.argmax(loglik)
+        return cls(mu, omega[best], a[best], b[best], sigma2[best])
+
+    def scale(self):
+        long_run = self.omega / max(1 - self.alpha - self.beta, 1e-6)
+        return self.mu, np.sqrt(max(long_run, self.sigma2))
+
+    def log_returns(self, rng, trials, steps, dtype=np.float64):
+        Z = rng.standard_normal((trials, steps), dtype=dtype)
+        out = np.empty_like(Z)
+        sigma2 = np.full(trials, self.sigma2)
+        for t in range(steps):
+            eps = np.sqrt(sigma2) * Z[:, t]
+            out[:, t] = self.mu + eps
+            sigma2 = self.omega + self.alpha * eps * eps + self.beta * sigma2
+        return out
+
+
+MODELS = {"gbm": GBM, "bootstrap": BlockBootstrap, "garch": GARCH}
+
+
+def fit_model(name, stats, **params):
+    # Model `name` fitted to a return_stats frame
+    if name not in MODELS:
+        raise ValueError("unknown model {!r}".format(name))
+    return MODELS[name].fit(stats, **params)
@@ -0,0 +1,164 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from market import NEW_YORK, is_market_open, next_close
+
+
+log = logging.getLogger(__name__)
+
+
+class AccessStats:
+    """Thread-safe request counter per ticker, used to pick what to keep warm."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.lock = threading.Lock()
+
+    def record(self, ticker):
+        with self.lock:
+            self.counts[ticker] += 1
+
+    def most_common(self, n):
+        with self.lock:
+            return [ticker for ticker, _ in self.counts.most_common(n)]
+
+
+class RefreshLock:
+    """Elects one process to run each refresh when several workers schedule it.
+
+    An exclusive flock on `path` lets one process in at a time; the file holds
+    when the last refresh finished, so a process that gets the lock afterwards
+    sees that the refresh due at that time has already been done. Without fcntl
+    (Windows) every process refreshes, as before.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @contextmanager
+    def claim(self, due):
+        # Yields True if this process should run the refresh that was due at `due`
+        try:
+            import fcntl
+        except ImportError:
+            yield True
+            return
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                text = f.read().strip()
+                if text and float(text) >= due:
+                    yield False
+                    return
+                yield True
+                f.seek(0)
+                f.truncate()
+                f.write(repr(time.time()))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class WarmupScheduler:
+    """Background thread keeping a watchlist and the most requested tickers warm.
+
+    warm(ticker) is called for every tracked ticker at start-up and then every
+    `interval` seconds; once the market has closed, refresh(tickers) first pulls
+    the closing bars and everything is warmed again for the next session. With a
+    refresh_lock only one process runs each refresh; the others just warm up.
+    """
+
+    def __init__(self, warm, watchlist=(), stats=None, top_n=10, interval=900,
+                 refresh=None, close_delay=timedelta(minutes=20), refresh_lock=None):
+        self.warm = warm
+        self.watchlist = [t for t in watchlist if t]
+        self.stats = stats
+        self.top_n = top_n
+        self.interval = interval
+        self.refresh = refresh
+        self.close_delay = close_delay
+        self.refresh_lock = refresh_lock  # RefreshLock shared by the worker processes
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.info = dict(runs=0, warmed=0, errors=0, last_run=None, last_refresh=None, running=False)
+
+    def tickers(self):
+        tickers = list(self.watchlist)
+        if self.stats is not None:
+            tickers += [t for t in self.stats.most_common(self.top_n) if t not in tickers]
+        return tickers
+
+    def _refresh(self, tickers, due):
+        if self.refresh_lock is None:
+            self.refresh(tickers)
+            return True
+        with self.refresh_lock.claim(due) as elected:
+            if elected:
+                self.refresh(tickers)
+            return elected
+
+    def run_once(self, refresh=False, due=None):
+        # due: when the refresh became due, for the refresh_lock election
+        tickers = self.tickers()
+        self.info["running"] = True
+        try:
+            if refresh and self.refresh is not None:
+                try:
+                    if self._refresh(tickers, time.time() if due is None else due):
+                        self.info["last_refresh"] = time.time()
+                except Exception:
+                    self.info["errors"] += 1
+                    log.warning("refresh of %s failed", ",".join(tickers), exc_info=True)
+            for ticker in tickers:
+                if self.stop_event.is_set():
+                    break
+                try:
+                    self.warm(ticker)
+                    self.info["warmed"] += 1
+                except Exception:
+                    self.info["errors"] += 1
+                    log.warning("warm-up of %s failed", ticker, exc_info=True)
+        finally:
+            self.info["runs"] += 1
+            self.info["last_run"] = time.time()
+            self.info["running"] = False
+
+    def _next_refresh(self):
+        # close_delay after the most recent close that has not been refreshed yet
+        return next_close(datetime.now(NEW_YORK) - self.close_delay) + self.close_delay
+
+    def _loop(self):
+        self.run_once()
+        refresh_at = self._next_refresh()
+        while not self.stop_event.is_set():
+            wait = min(self.interval, max(0, refresh_at.timestamp() - time.time()))
+            if self.stop_event.wait(wait):
+                break
+            due_at = refresh_at.timestamp()
+            due = time.time() >= due_at
+            if due:
+                refresh_at = self._next_refresh()
+            if due or is_market_open():
+                self.run_once(refresh=due, due=due_at)
+
+    def start(self):
+        # Returns immediately; the first warm-up runs on the background thread
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._loop, name="warmup", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,174 @@
+import logging
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+log = logging.getLogger(__name__)
+
+
+#%% Log-return statistics
+# One row per bar: the log-return, running count/sum/sum of squares, expanding
+# and rolling mean/variance and the EWMA variance. Everything is derived from
+# cumulative sums, so a full pass is O(n) and appending bars only needs the last
+# `window` rows of the previous frame.
+
+SUMS = ("count", "sum", "sumsq")
+
+
+def extend_stats(prev, hist, window=21, lam=0.94):
+    """Stats frame of prev with the bars of hist after its last date appended.
+
+    prev is None to start from scratch. lam is the EWMA decay of the variance
+    (0.94 as in RiskMetrics).
+    """
+    if prev is not None and len(prev):
+        hist = hist[hist["Date"] > prev["Date"].iloc[-1]]
+        last = prev.iloc[-1]
+        prev_close, base, seed = last["Close"], [last[c] for c in SUMS], last["ewma_var"]
+        tail = prev.iloc[-window:]
+    else:
+        prev = None
+        prev_close, base, seed = np.nan, [0, 0.0, 0.0], np.nan
+        tail = None
+    if hist.empty:
+        return prev
+
+    close = hist["Close"].to_numpy(dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.log(close / np.append(prev_close, close[:-1]))
+    ok = np.isfinite(r)
+    r0 = np.where(ok, r, 0.0)
+    sums = dict(zip(SUMS, (base[0] + np.cumsum(ok), base[1] + np.cumsum(r0), base[2] + np.cumsum(r0 ** 2))))
+
+    # The running sums `window` bars earlier; zero before the first bar
+    lagged = {}
+    for c in SUMS:
+        head = tail[c].to_numpy(dtype=np.float64) if tail is not None else np.empty(0)
+        full = np.concatenate([np.zeros(window - len(head)), head, sums[c]])
+        lagged[c] = full[:len(r)]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        n, s1, s2 = sums["count"], sums["sum"], sums["sumsq"]
+        mean = s1 / n
+        var = np.where(n > 1, (s2 - s1 * mean) / (n - 1), np.nan)
+        wn = n - lagged["count"]
+        w1 = s1 - lagged["sum"]
+        w2 = s2 - lagged["sumsq"]
+        rolling_mean = w1 / wn
+        rolling_var = np.where(wn > 1, (w2 - w1 * rolling_mean) / (wn - 1), np.nan)
+
+    # v_t = lam * v_{t-1} + (1 - lam) * r_t^2, continued from the previous frame
+    squared = pd.Series(np.concatenate([[seed], np.where(ok, r ** 2, np.nan)]))
+    ewma_var = squared.ewm(alpha=1 - lam, adjust=False, ignore_na=True).mean().to_numpy()[1:]
+
+    frame = pd.DataFrame(dict(
+        Date = hist["Date"].reset_index(drop=True),
+        Close = close,
+        log_return = r,
+        count = n.astype(np.int64),
+        sum = s1,
+        sumsq = s2,
+        mean = mean,
+        var = np.maximum(var, 0),
+        rolling_mean = rolling_mean,
+        rolling_var = np.maximum(rolling_var, 0),
+        ewma_var = ewma_var,
+    ))
+    return frame if prev is None else pd.concat([prev, frame], ignore_index=True)
+
+
+def gbm_parameters(stats, estimator="expanding"):
+    # (s0, drift, stdev) for the simulation from the last row of a stats frame.
+    # The mean log-return already is the drift of the log-price, so no -var/2
+    # correction: the models simulate log-returns directly and share this drift.
+    last = stats.iloc[-1]
+    if estimator == "expanding":
+        u, var = last["mean"], last["var"]
+    elif estimator == "rolling":
+        u, var = last["rolling_mean"], last["rolling_var"]
+    elif estimator == "ewma":
+        u, var = last["mean"], last["ewma_var"]
+    else:
+        raise ValueError("unknown estimator {!r}".format(estimator))
+    return last["Close"], u, np.sqrt(var)
+
+
+class ReturnStatsStore:
+    """Return statistics per ticker, kept in memory and persisted as feather.
+
+    get() appends only the bars newer than the stored frame and recomputes from
+    scratch when the history no longer matches it (e.g. after a split or
+    dividend adjustment changed past closes).
+    """
+
+    def __init__(self, root, window=21, lam=0.94):
+        self.root = root
+        self.window = window
+        self.lam = lam
+        self.frames = {}
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A background job forked while the warm-up thread held the lock would
+        # otherwise block on it forever
+        self.lock = threading.Lock()
+
+    def path(self, ticker):
+        return os.path.join(self.root, "{}.stats.feather".format(ticker.upper()))
+
+    def read(self, ticker):
+        path = self.path(ticker)
+        if not os.path.exists(path):
+            return None
+        try:
+            return pd.read_feather(path)
+        except Exception:
+            # Treated as missing: get() recomputes the stats from the history
+            log.warning("unreadable return stats for %s", ticker, exc_info=True)
+            return None
+
+    def write(self, ticker, stats):
+        # Through a temp file of its own, so concurrent writers never share one
+        path = self.path(ticker)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".{}.".format(ticker.upper()), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                stats.to_feather(f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    @staticmethod
+    def matches(stats, hist):
+        # hist still contains the last stored bar with the same close
+        if stats is None or stats.empty or hist.empty:
+            return False
+        last = stats.iloc[-1]
+        i = hist["Date"].searchsorted(last["Date"])
+        return (i < len(hist) and hist["Date"].iloc[i] == last["Date"]
+                and np.isclose(hist["Close"].iloc[i], last["Close"], rtol=1e-9, atol=0)
+                and hist["Date"].iloc[0] == stats["Date"].iloc[0])
+
+    def get(self, ticker, hist):
+        with self.lock:
+            stats = self.frames.get(ticker)
+            if stats is None:
+                stats = self.read(ticker)
+            if not self.matches(stats, hist):
+                stats = None
+            updated = extend_stats(stats, hist, self.window, self.lam)
+            if updated is not stats and updated is not None:
+                self.write(ticker, updated)
+            self.frames[ticker] = updated
+            return updated
+
+    def parameters(self, ticker, hist, estimator="expanding"):
+        return gbm_parameters(self.get(ticker, hist), estimator)
@@ -0,0 +1,27 @@
+import logging
+import time
+
+from flask import g
+
+
+def install_timing(server, started, log=logging.getLogger(__name__).info):
+    # Adds a Server-Timing header to every response and records how long after
+    # `started` (a time.perf_counter() value) the first response went out
+    timing = dict(first_byte=None, requests=0)
+
+    @server.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @server.after_request
+    def _stop_timer(response):
+        now = time.perf_counter()
+        elapsed = now - g.get("request_started", now)
+        response.headers["Server-Timing"] = "app;dur={:.1f}".format(elapsed * 1000)
+        timing["requests"] += 1
+        if timing["first_byte"] is None:
+            timing["first_byte"] = now - started
+            log("Time to first byte: {:.3f}s after start-up".format(timing["first_byte"]))
+        return response
+
+    return timing
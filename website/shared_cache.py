@@ -0,0 +1,196 @@
+import hashlib
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+
+#%% Serialization
+# One tag byte followed by the payload: Arrow IPC for DataFrames, compact JSON for
+# plotly figures, dict figures and other plain values, and length-prefixed parts
+# for tuples. Nothing is unpickled, so whoever can write to the backend cannot
+# make the app run code; values JSON cannot hold are simply not shared.
+
+def _json_dumps(value):
+    try:
+        import orjson
+    except ImportError:
+        import json
+        return json.dumps(value, separators=(",", ":"),
+                          default=lambda v: v.tolist() if hasattr(v, "tolist") else str(v)).encode()
+    return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _json_loads(payload):
+    try:
+        import orjson
+    except ImportError:
+        import json
+        return json.loads(payload)
+    return orjson.loads(payload)
+
+
+def serialize(value):
+    import pandas as pd
+    from plotly.basedatatypes import BaseFigure
+    if isinstance(value, pd.DataFrame):
+        import pyarrow as pa
+        table = pa.Table.from_pandas(value, preserve_index=True)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return b"A" + sink.getvalue().to_pybytes()
+    if isinstance(value, BaseFigure):
+        import plotly.io as pio
+        return b"F" + pio.to_json(value, pretty=False, validate=False).encode()
+    if isinstance(value, dict) and "data" in value and "layout" in value:
+        from figures import figure_json
+        return b"J" + figure_json(value)
+    if isinstance(value, tuple):
+        parts = [serialize(v) for v in value]
+        return b"T" + struct.pack("<I", len(parts)) + b"".join(
+            struct.pack("<Q", len(part)) + part for part in parts)
+    # Raises TypeError for anything JSON cannot represent
+    return b"S" + _json_dumps(value)
+
+
+def deserialize(data):
+    tag, payload = data[:1], data[1:]
+    if tag == b"A":
+        import pyarrow as pa
+        return pa.ipc.open_stream(payload).read_all().to_pandas()
+    if tag == b"F":
+        import plotly.io as pio
+        return pio.from_json(payload.decode(), skip_invalid=True)
+    if tag in (b"J", b"S"):
+        return _json_loads(payload)
+    if tag == b"T":
+        (count,), offset, parts = struct.unpack_from("<I", payload), 4, []
+        for _ in range(count):
+            (size,) = struct.unpack_from("<Q", payload, offset)
+            offset += 8
+            parts.append(deserialize(payload[offset:offset + size]))
+            offset += size
+        return tuple(parts)
+    raise ValueError("Unknown shared cache entry tag: {!r}".format(tag))
+
+
+def make_key(name, key):
+    return "dash-cache:{}:{}".format(name, hashlib.sha1(repr(key).encode()).hexdigest())
+
+
+#%% Backends
+# A backend stores bytes under a string key with an optional ttl in seconds.
+
+class SQLiteBackend:
+    def __init__(self, path, purge_interval=300):
+        self.path = path
+        self.local = threading.local()
+        self.inherited = []
+        os.register_at_fork(after_in_child=self._after_fork)
+        # Expired rows of keys that are never read again are deleted in bulk
+        self.purge_interval = purge_interval
+        self.last_purge = time.monotonic()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+
+    def _after_fork(self):
+        # SQLite connections must not be used across a fork: the child opens its
+        # own. The inherited one is kept referenced, never used or closed here.
+        self.inherited.append(self.local)
+        self.local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= time.time():
+            self.delete(key)
+            return None
+        return row[0]
+
+    def set(self, key, value, ttl=None):
+        expires = None if ttl is None else time.time() + ttl
+        self._connect().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+            (key, sqlite3.Binary(value), expires))
+        if time.monotonic() - self.last_purge > self.purge_interval:
+            self.purge()
+
+    def purge(self):
+        self.last_purge = time.monotonic()
+        self._connect().execute(
+            "DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+class RedisBackend:
+    # Works with redis.Redis or anything speaking the same get/set/delete calls
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, ex=None if ttl is None else max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class MemoryRedis:
+    # In-process stand-in for a Redis server, for running RedisBackend locally
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value, expires = self.data.get(key, (None, None))
+            if expires is not None and expires <= time.time():
+                del self.data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self.lock:
+            self.data[key] = (value, None if ex is None else time.time() + ex)
+        return True
+
+    def delete(self, key):
+        with self.lock:
+            return int(self.data.pop(key, None) is not None)
+
+
+def backend_from_url(url):
+    # sqlite:///path/to/cache.db, redis://host:port/db or memory://
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+        return RedisBackend(redis.Redis.from_url(url))
+    if url.startswith("memory://"):
+        return RedisBackend(MemoryRedis())
+    raise ValueError("Unsupported cache url: {}".format(url))
@@ -0,0 +1,189 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+
+#%% Monte Carlo engine
+# Paths are built from cumulative sums of log-returns in one numpy step; large
+# trial counts are streamed through chunks of about chunk_elements values
+# (trials * days) so memory stays bounded however long the horizon, and only the
+# summary statistics are kept. Every chunk draws from its own stream spawned from
+# the seed, so the chunks can run on a process pool and the result only depends
+# on (seed, trials, days, chunk_elements).
+
+PERCENTILES = (5, 25, 50, 75, 95)
+# Values per chunk; a chunk holds a few float64/int64 arrays of this size
+CHUNK_ELEMENTS = 2_000_000
+# Largest trials * days simulate_summary runs
+MAX_ELEMENTS = int(os.environ.get("MAX_SIM_ELEMENTS", 50_000_000))
+
+
+def _log_paths(rng, model, days, trials, dtype):
+    # Cumulative log-return of each trial, day 0 being the starting price
+    log_paths = np.zeros((trials, days), dtype=dtype)
+    np.cumsum(model.log_returns(rng, trials, days - 1, dtype), axis=1, out=log_paths[:, 1:])
+    return log_paths
+
+
+def simulate_paths(s0, model, days=30, trials=100, seed=None, dtype=np.float64):
+    # Price paths of a models.py model as a (trials, days) array
+    rng = np.random.default_rng(seed)
+    return s0 * np.exp(_log_paths(rng, model, days, trials, dtype))
+
+
+def _band_edges(drift, stdev, days, bins):
+    # Fixed log-price histogram range per day wide enough for +-8 sigma
+    t = np.arange(days)
+    half = 8 * stdev * np.sqrt(t) + 1e-9
+    lo = drift * t - half
+    width = 2 * half / bins
+    return lo, width
+
+
+def _histogram_percentiles(counts, lo, width, percentiles):
+    # Percentiles per day from per-day histogram counts, interpolated in the bin
+    total = counts[0].sum()
+    cum = np.cumsum(counts, axis=1)
+    bands = np.empty((len(percentiles), counts.shape[0]))
+    for i, q in enumerate(percentiles):
+        target = q / 100 * total
+        idx = np.array([np.searchsorted(row, target) for row in cum])
+        idx = np.minimum(idx, counts.shape[1] - 1)
+        below = np.where(idx > 0, cum[np.arange(len(idx)), idx - 1], 0)
+        inside = counts[np.arange(len(idx)), idx]
+        frac = np.where(inside > 0, (target - below) / np.maximum(inside, 1), 0.5)
+        bands[i] = lo + (idx + frac) * width
+    return bands
+
+
+def _chunk_sizes(trials, days, chunk_elements):
+    # Trials per chunk, as many as fit in chunk_elements values
+    rows = max(chunk_elements // days, 1)
+    return [min(rows, trials - start) for start in range(0, trials, rows)]
+
+
+def _simulate_chunk(task):
+    # Partial results of one chunk; runs in a worker process when workers > 1
+    seed, n, model, days, sample, single, percentiles, bins, dtype = task
+    rng = np.random.default_rng(seed)
+    log_paths = _log_paths(rng, model, days, n, dtype)
+    out = dict(
+        total = np.exp(log_paths).sum(axis=0),
+        terminal = log_paths[:, -1].astype(np.float64),
+        paths = log_paths[:sample],
+    )
+    if single:
+        out["bands"] = np.percentile(log_paths, percentiles, axis=0)
+    else:
+        lo, width = _band_edges(*model.scale(), days, bins)
+        idx = ((log_paths - lo) / width).astype(np.int64)
+        np.clip(idx, 0, bins - 1, out=idx)
+        offsets = (np.arange(days) * bins)[None, :]
+        out["counts"] = np.bincount((idx + offsets).ravel(), minlength=days * bins).reshape(days, bins)
+    return out
+
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def _pool(workers):
+    # One long-lived process pool per worker count
+    with _pool_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(workers)
+        return _pools[workers]
+
+
+def _forget_pools():
+    # A forked child (e.g. a background callback job) cannot use its parent's pools
+    global _pool_lock
+    _pool_lock = threading.Lock()
+    _pools.clear()
+
+
+os.register_at_fork(after_in_child=_forget_pools)
+
+
+_progress = threading.local()
+
+
+@contextmanager
+def reporting_progress(fn):
+    # simulate_summary calls on this thread report fn(done, trials) after each chunk
+    previous = getattr(_progress, "fn", None)
+    _progress.fn = fn
+    try:
+        yield
+    finally:
+        _progress.fn = previous
+
+
+def simulate_summary(s0, model, days=30, trials=10000, seed=None,
+                     percentiles=PERCENTILES, alpha=0.95, chunk_elements=CHUNK_ELEMENTS,
+                     sample=0, bins=2048, dtype=np.float64, workers=1, progress=None,
+                     max_elements=MAX_ELEMENTS):
+    """Summary statistics of a simulation of `model` without keeping every path.
+
+    Returns a dict with the percentile bands per day, the mean path, the
+    terminal price of every trial, VaR/CVaR of the terminal return at level
+    alpha and the first `sample` paths. Chunks run on `workers` processes; the
+    output is bit-identical for a given seed whatever the worker count.
+    progress(done, trials), or the one set by reporting_progress, is called as
+    chunks complete. Raises ValueError when trials * days exceeds max_elements.
+    """
+    if trials * days > max_elements:
+        raise ValueError("{} trials of {} days exceed {} simulated values".format(trials, days, max_elements))
+    progress = progress or getattr(_progress, "fn", None)
+    sizes = _chunk_sizes(trials, days, chunk_elements)
+    single = len(sizes) == 1
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(chunk_seed, n, model, days, sample if i == 0 else 0,
+              single, tuple(percentiles), bins, dtype)
+             for i, (chunk_seed, n) in enumerate(zip(seeds, sizes))]
+    if workers > 1 and not single:
+        results = _pool(workers).map(_simulate_chunk, tasks)
+    else:
+        results = map(_simulate_chunk, tasks)
+
+    # Partial results are combined in chunk order
+    counts = np.zeros((days, bins), dtype=np.int64)
+    total = np.zeros(days)
+    terminal = np.empty(trials)
+    paths = None
+    bands = None
+    done = 0
+    for n, out in zip(sizes, results):
+        if paths is None:
+            paths = s0 * np.exp(out["paths"])
+        if single:
+            bands = np.log(s0) + out["bands"]
+        else:
+            counts += out["counts"]
+        total += out["total"]
+        terminal[done:done + n] = s0 * np.exp(out["terminal"])
+        done += n
+        if progress is not None:
+            progress(done, trials)
+
+    if bands is None:
+        lo, width = _band_edges(*model.scale(), days, bins)
+        bands = np.log(s0) + _histogram_percentiles(counts, lo, width, percentiles)
+
+    returns = terminal / s0 - 1
+    cutoff = np.quantile(returns, 1 - alpha)
+    return dict(
+        days = days,
+        trials = trials,
+        percentiles = tuple(percentiles),
+        bands = np.exp(bands),
+        mean = s0 * total / trials,
+        terminal = terminal,
+        var = -cutoff,
+        cvar = -returns[returns <= cutoff].mean(),
+        alpha = alpha,
+        paths = paths,
+    )
@@ -0,0 +1,86 @@
+import os
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from functools import wraps
+
+
+# Every single_flight group registers itself here so its counters can be inspected
+flights = {}
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers share its result.
+
+    Followers wait at most `timeout` seconds for the leader, then run the call
+    themselves, so a stuck leader cannot hang every request for its key.
+    """
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.in_flight = {}  # key -> Future
+        self.stats = dict(calls=0, executions=0, coalesced=0, errors=0, timeouts=0)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The leaders of in-flight calls are threads of the parent and never finish
+        # here; a forked child (e.g. a background callback job) starts empty
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self.lock:
+            self.stats["calls"] += 1
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self.in_flight[key] = Future()
+                self.stats["executions"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            try:
+                return future.result(self.timeout)
+            except FutureTimeout:
+                with self.lock:
+                    self.stats["timeouts"] += 1
+                return fn(*args, **kwargs)
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            with self.lock:
+                self.stats["errors"] += 1
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def info(self):
+        with self.lock:
+            return dict(self.stats, in_flight=len(self.in_flight))
+
+
+# Seconds a follower waits for the leader's result
+TIMEOUT = float(os.environ.get("FLIGHT_TIMEOUT", 60))
+
+
+def single_flight(func):
+    # Coalesce concurrent calls with the same arguments into one execution
+    group = SingleFlight(TIMEOUT)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return group.do((args, tuple(sorted(kwargs.items()))), func, *args, **kwargs)
+
+    wrapper.flight_info = group.info
+    flights[func.__qualname__] = wrapper
+    return wrapper
+
+
+def flight_stats():
+    return {name: wrapper.flight_info() for name, wrapper in flights.items()}
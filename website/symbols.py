@@ -0,0 +1,144 @@
+import os
+import re
+import threading
+import time
+
+from dash.exceptions import PreventUpdate
+
+
+SYMBOLS_FILE = os.environ.get(
+    "SYMBOLS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "symbols.txt"))
+
+# What a ticker can look like: AAPL, BRK-B, BF.B, ^GSPC, EURUSD=X, 0700.HK
+SYMBOL_PATTERN = re.compile(r"^[A-Z0-9^][A-Z0-9.\-=^]{0,14}$")
+
+
+class SymbolIndex:
+    """Listed symbols for the input's autocomplete, plus provider lookups.
+
+    The list is only a shortlist: a well-formed symbol missing from it is asked
+    about once through exists() and the answer remembered, confirmed symbols
+    for good and rejected ones for reject_ttl seconds.
+    """
+
+    def __init__(self, names, reject_ttl=3600):
+        # names: {symbol: company name}
+        self.names = names
+        self.symbols = sorted(names)
+        self.reject_ttl = reject_ttl
+        self.checked = {}  # symbol -> (known, checked_at)
+        self.lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # Answers already remembered stay; a lock held by a parent thread does not
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path):
+        names = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                fields = re.split(r"[|,\t]", line, maxsplit=1)
+                symbol = fields[0].strip().upper()
+                if symbol and symbol != "SYMBOL":
+                    names[symbol] = fields[1].strip() if len(fields) > 1 else ""
+        return cls(names)
+
+    def __contains__(self, symbol):
+        return symbol in self.names
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def normalize(self, value):
+        # The upper-cased symbol if it is well-formed, otherwise None
+        if not value:
+            return None
+        symbol = value.strip().upper()
+        return symbol if SYMBOL_PATTERN.match(symbol) else None
+
+    def is_known(self, symbol, exists=None):
+        # Listed, or confirmed by exists(symbol) (e.g. a non-empty download)
+        if symbol in self.names:
+            return True
+        if exists is None:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            known, checked_at = self.checked.get(symbol, (None, None))
+        if known or (known is False and now - checked_at < self.reject_ttl):
+            return known
+        try:
+            known = bool(exists(symbol))
+        except Exception:
+            known = False
+        with self.lock:
+            self.checked[symbol] = (known, now)
+        return known
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def _reset_lock():
+    global _lock
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_lock)
+
+
+def symbol_index():
+    # Built once per process from SYMBOLS_FILE
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = SymbolIndex.from_file(SYMBOLS_FILE)
+    return _index
+
+
+class UnknownSymbol(PreventUpdate):
+    """A PreventUpdate for an input that is not a symbol the provider knows.
+
+    Figure callbacks let it leave their output alone; symbol_message turns it
+    into text for the page.
+    """
+
+
+def valid_ticker(value, default="AAPL", exists=None):
+    # Empty input falls back to the default; symbols not in the list are checked
+    # with exists(symbol) before they reach the download or the simulation
+    if not value:
+        return default
+    index = symbol_index()
+    ticker = index.normalize(value)
+    if ticker is None:
+        raise UnknownSymbol("{} is not a ticker symbol".format(value.strip()))
+    if not index.is_known(ticker, exists):
+        raise UnknownSymbol("No price history for {}".format(ticker))
+    return ticker
+
+
+def symbol_message(value, exists=None):
+    # Text for the output div: why the figures did not change, or nothing
+    try:
+        valid_ticker(value, exists=exists)
+    except UnknownSymbol as e:
+        return str(e)
+    return ""
+
+
+def symbol_datalist(id="symbol-list"):
+    # <datalist> backing the browser's autocomplete for a dcc.Input(list=id)
+    from dash import html
+    index = symbol_index()
+    return html.Datalist(
+        id = id,
+        children = [html.Option(value = s, label = index.names[s]) for s in index.symbols]
+    )
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from analytics import VolumeBuckets
+
+
+def bars(closes, volumes, start="2024-01-02"):
+    dates = pd.bdate_range(start, periods=len(closes), tz="America/New_York")
+    return pd.DataFrame(dict(Date=dates, Close=closes, Volume=volumes))
+
+
+def test_revised_last_bar_is_replaced_not_skipped():
+    rng = np.random.default_rng(0)
+    closes = 100 * np.cumprod(1 + rng.normal(0, 0.01, 60))
+    volumes = rng.integers(1_000, 10_000, 60)
+    final = bars(closes, volumes)
+
+    # The last bar was fetched intraday: different close, partial volume
+    partial = final.iloc[:50].copy()
+    partial.loc[49, ["Close", "Volume"]] = [closes[49] * 1.05, 500]
+    state = VolumeBuckets.fit(partial, buckets=5)
+    state.add(final)
+
+    expected = VolumeBuckets(state.edges).add(final)
+    assert state.count.tolist() == expected.count.tolist()
+    np.testing.assert_allclose(state.sums, expected.sums, rtol=1e-9, atol=1e-12)
+
+
+def test_unchanged_history_adds_nothing():
+    hist = bars([1.0, 2.0, 3.0, 4.0], [10, 20, 30, 40])
+    state = VolumeBuckets.fit(hist, buckets=2)
+    count = state.count.copy()
+    state.add(hist)
+    assert state.count.tolist() == count.tolist()
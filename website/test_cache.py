@@ -0,0 +1,17 @@
+from cache import ttl_cache
+
+
+def test_entry_is_stored_under_the_version_after_the_call():
+    # Like a load that rewrites the file whose mtime is the version
+    state = dict(version=0, calls=0)
+
+    @ttl_cache(maxsize=4, version=lambda ticker: state["version"])
+    def load(ticker):
+        state["calls"] += 1
+        state["version"] += 1
+        return ticker.lower()
+
+    assert load("AAPL") == "aapl"
+    assert load("AAPL") == "aapl"
+    assert state["calls"] == 1
+    assert load.cache_info()["misses"] == 1
@@ -0,0 +1,78 @@
+import os
+
+import pandas as pd
+
+from data_store import CompactHistory, FrameProvider, MultiTickerLoader, OHLCVStore
+
+
+def bars(closes, start="2024-01-02"):
+    dates = pd.bdate_range(start, periods=len(closes), tz="America/New_York")
+    return pd.DataFrame(dict(Date=dates, Open=closes, High=closes, Low=closes, Close=closes,
+                             Volume=[1000] * len(closes)))
+
+
+def test_load_fetches_full_history_once(tmp_path):
+    provider = FrameProvider({"AAPL": bars([1.0, 2.0, 3.0])})
+    store = OHLCVStore(str(tmp_path), provider)
+
+    assert store.load("AAPL")["Close"].tolist() == [1.0, 2.0, 3.0]
+    assert store.load("AAPL")["Close"].tolist() == [1.0, 2.0, 3.0]
+    # The second load is answered from the fresh file
+    assert provider.calls == [("AAPL", "max", None)]
+
+
+def test_refresh_appends_new_bars_and_replaces_the_last_one(tmp_path):
+    provider = FrameProvider({"AAPL": bars([1.0, 2.0, 3.5])}) # 3.5: intraday partial bar
+    store = OHLCVStore(str(tmp_path), provider)
+    store.load("AAPL")
+
+    # The day closes at 3.0 and two more bars arrive
+    provider.frames["AAPL"] = bars([1.0, 2.0, 3.0, 4.0, 5.0])
+    hist = store.load("AAPL", refresh=True)
+
+    assert hist["Close"].tolist() == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert hist["Date"].is_unique and hist["Date"].is_monotonic_increasing
+    # Only asked for bars from the last stored date on
+    ticker, period, start = provider.calls[-1]
+    assert start == hist["Date"].iloc[2].date()
+    assert store.read("AAPL")["Close"].tolist() == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_refresh_keeps_stored_bars_when_the_provider_fails(tmp_path):
+    provider = FrameProvider({"AAPL": bars([1.0, 2.0])})
+    store = OHLCVStore(str(tmp_path), provider)
+    store.load("AAPL")
+
+    provider.frames = {}
+    assert store.load("AAPL", refresh=True)["Close"].tolist() == [1.0, 2.0]
+
+
+def test_multi_ticker_loader_reloads_expired_series(tmp_path):
+    provider = FrameProvider({"AAPL": bars([1.0, 2.0]), "MSFT": bars([5.0, 6.0])})
+    store = OHLCVStore(str(tmp_path), provider, max_age=0)
+    loader = MultiTickerLoader(store, ttl=0)
+    assert loader.load(["AAPL", "MSFT"])["AAPL"].tolist() == [1.0, 2.0]
+
+    provider.frames["AAPL"] = bars([1.0, 2.5, 3.0])
+    assert loader.load(["AAPL", "MSFT"])["AAPL"].tolist() == [1.0, 2.5, 3.0]
+
+
+def test_compact_keeps_zero_volume_and_drops_empty_actions():
+    # FX pairs and indices report no volume at all
+    hist = bars([1.0, 2.0, 3.0]).assign(Volume=0, Dividends=0.0, **{"Stock Splits": 0.0})
+    compact = CompactHistory().compact("^VIX", hist)
+    assert compact.columns.tolist() == ["Date", "Open", "High", "Low", "Close", "Volume"]
+    assert compact["Volume"].tolist() == [0, 0, 0]
+
+
+def test_generation_changes_when_any_history_is_rewritten(tmp_path):
+    provider = FrameProvider({"AAPL": bars([1.0, 2.0]), "MSFT": bars([5.0, 6.0])})
+    store = OHLCVStore(str(tmp_path), provider, max_age=0)
+    assert store.generation() == 0
+    store.load("AAPL")
+    os.utime(store.path("AAPL"), ns=(10**18, 10**18))  # an older write, whatever the clock resolution
+    before = store.generation()
+
+    provider.frames["MSFT"] = bars([5.0, 6.0, 7.0])
+    store.load("MSFT", refresh=True)
+    assert store.generation() > before
@@ -0,0 +1,38 @@
+import threading
+import time
+
+import pytest
+
+from fetch_pool import FetchPool
+
+
+def test_retries_failures_then_falls_back_to_the_last_good_result():
+    pool = FetchPool(max_workers=2, timeout=5, retries=2, backoff=0.01)
+    calls = []
+
+    def fetch(x):
+        calls.append(x)
+        if len(calls) > 1:
+            raise ConnectionError("down")
+        return x * 2
+
+    assert pool.call(fetch, 21) == 42
+    assert pool.call(fetch, 21) == 42  # three failed attempts, then the snapshot
+    assert len(calls) == 4
+
+
+def test_a_slow_attempt_is_not_retried_and_the_deadline_bounds_the_call():
+    pool = FetchPool(max_workers=2, timeout=0.2, retries=2, backoff=0.01)
+    running = []
+    release = threading.Event()
+
+    def stuck():
+        running.append(1)
+        release.wait(5)
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pool.call(stuck)
+    assert time.monotonic() - started < 1
+    assert len(running) == 1
+    release.set()
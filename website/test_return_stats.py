@@ -0,0 +1,31 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from return_stats import ReturnStatsStore, extend_stats
+
+
+def history(closes, start="2024-01-02"):
+    dates = pd.bdate_range(start, periods=len(closes), tz="America/New_York")
+    return pd.DataFrame(dict(Date=dates, Close=closes))
+
+
+def test_concurrent_writes_leave_a_readable_file(tmp_path):
+    stats = extend_stats(None, history([1.0, 1.1, 1.2, 1.3]))
+    store = ReturnStatsStore(str(tmp_path))
+    with ThreadPoolExecutor(6) as pool:
+        list(pool.map(lambda _: store.write("AAPL", stats), range(60)))
+
+    assert store.read("AAPL")["Close"].tolist() == [1.0, 1.1, 1.2, 1.3]
+    assert os.listdir(tmp_path) == ["AAPL.stats.feather"]
+
+
+def test_unreadable_file_is_recomputed(tmp_path):
+    store = ReturnStatsStore(str(tmp_path))
+    with open(store.path("AAPL"), "wb") as f:
+        f.write(b"not a feather file")
+
+    stats = store.get("AAPL", history([1.0, 2.0, 4.0]))
+    assert stats["Close"].tolist() == [1.0, 2.0, 4.0]
+    assert store.read("AAPL")["Close"].tolist() == [1.0, 2.0, 4.0]
@@ -0,0 +1,15 @@
+import os
+
+from shared_cache import SQLiteBackend
+
+
+def test_forked_child_opens_its_own_sqlite_connection(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.db"))
+    backend.set("key", b"parent")
+    parent_conn = backend.local.conn
+    pid = os.fork()
+    if pid == 0:
+        ok = backend.get("key") == b"parent" and backend.local.conn is not parent_conn
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
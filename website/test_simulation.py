@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from models import GBM, MODELS, fit_model
+from return_stats import extend_stats
+from simulation import simulate_paths, simulate_summary
+
+
+def test_chunks_hold_a_fixed_number_of_values():
+    steps = []
+    summary = simulate_summary(100.0, GBM(0.0, 0.01), days=250, trials=1000, seed=1,
+                               chunk_elements=100_000, progress=lambda done, total: steps.append(done))
+    # 400 trials of 250 days per chunk, whatever the trial count
+    assert steps == [400, 800, 1000]
+    assert summary["terminal"].shape == (1000,)
+    assert np.isfinite(summary["bands"]).all()
+
+
+def test_rejects_more_values_than_the_cap():
+    with pytest.raises(ValueError):
+        simulate_summary(100.0, GBM(0.0, 0.01), days=500, trials=1000, max_elements=100_000)
+
+
+def test_result_does_not_depend_on_the_worker_count():
+    model = GBM(0.0002, 0.01)
+    args = dict(days=40, trials=12_000, seed=7, chunk_elements=100_000, sample=5)  # 5 chunks
+    one = simulate_summary(100.0, model, workers=1, **args)
+    two = simulate_summary(100.0, model, workers=2, **args)
+    for key in ("bands", "mean", "terminal", "paths"):
+        assert np.array_equal(one[key], two[key]), key
+    assert one["var"] == two["var"] and one["cvar"] == two["cvar"]
+
+
+def test_chunked_summary_agrees_with_a_single_chunk():
+    # Binned percentiles over several chunks vs exact ones over one chunk
+    model = GBM(0.0002, 0.01)
+    chunked = simulate_summary(100.0, model, days=30, trials=40_000, seed=3, chunk_elements=100_000)
+    single = simulate_summary(100.0, model, days=30, trials=40_000, seed=3, chunk_elements=10**7)
+    np.testing.assert_allclose(chunked["bands"], single["bands"], rtol=5e-3)
+    np.testing.assert_allclose(chunked["mean"], single["mean"], rtol=2e-3)
+    assert abs(chunked["var"] - single["var"]) < 5e-3
+
+
+def test_models_share_the_drift_of_a_steady_series():
+    # Constant log-return 0.001 a day: every model should follow it exactly
+    dates = pd.bdate_range("2024-01-02", periods=80, tz="America/New_York")
+    stats = extend_stats(None, pd.DataFrame(dict(Date=dates, Close=100 * np.exp(0.001 * np.arange(80)))))
+    expected = stats["Close"].iloc[-1] * np.exp(0.001 * 29)
+    with np.errstate(all="ignore"):  # GARCH's likelihood on a zero-variance series
+        for name in MODELS:
+            paths = simulate_paths(stats["Close"].iloc[-1], fit_model(name, stats), days=30, trials=200, seed=1)
+            assert np.isclose(np.median(paths[:, -1]), expected, rtol=1e-6), name
+
+
+def test_gbm_drift_is_the_mean_log_return():
+    rng = np.random.default_rng(2)
+    dates = pd.bdate_range("2024-01-02", periods=250, tz="America/New_York")
+    stats = extend_stats(None, pd.DataFrame(dict(Date=dates, Close=100 * np.exp(np.cumsum(rng.normal(0, 0.03, 250))))))
+    r = stats["log_return"].dropna()
+    assert np.isclose(GBM.fit(stats).drift, r.mean())
+    assert np.isclose(GBM.fit(stats).drift, MODELS["garch"].fit(stats).mu)
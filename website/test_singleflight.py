@@ -0,0 +1,42 @@
+import os
+import signal
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def test_follower_stops_waiting_for_a_stuck_leader():
+    group = SingleFlight(timeout=0.1)
+    release = threading.Event()
+    leader = threading.Thread(target=group.do, args=("AAPL", release.wait))
+    leader.start()
+    time.sleep(0.05)
+
+    assert group.do("AAPL", lambda: "own result") == "own result"
+    assert group.info()["timeouts"] == 1
+    release.set()
+    leader.join()
+
+
+def test_forked_child_does_not_inherit_held_lock_or_calls():
+    group = SingleFlight()
+    # A parent thread is inside do() when the fork happens
+    group.lock.acquire()
+    group.in_flight["AAPL"] = None
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if group.do("AAPL", lambda: 1) == 1 else 1)
+    group.lock.release()
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            break
+        time.sleep(0.01)
+    else:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        raise AssertionError("child deadlocked")
+    assert os.WEXITSTATUS(status) == 0
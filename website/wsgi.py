@@ -0,0 +1,12 @@
+"""WSGI entry point for the dashboard (assignment3_zhuoran).
+
+    gunicorn --workers 4 wsgi:server
+
+Each worker builds its own app and warm-up scheduler when it imports this module,
+so run without --preload (the scheduler thread would stay behind in the master).
+WARMUP=0 serves without the scheduler.
+"""
+from assignment3_zhuoran import create_app, warmup_enabled
+
+app = create_app(warmup = warmup_enabled())
+server = app.server